@@ -0,0 +1,13 @@
+from starlette.requests import Request
+
+from background_changer.utils.downloads import ImageDownloader
+
+
+def get_image_downloader(request: Request) -> ImageDownloader:  # pragma: no cover
+    """
+    Returns image downloader with the shared HTTP client.
+
+    :param request: current request.
+    :returns: image downloader.
+    """
+    return request.app.state.image_downloader
@@ -0,0 +1,25 @@
+from fastapi import FastAPI
+
+from background_changer.settings import settings
+from background_changer.utils.downloads import ImageDownloader, create_http_client
+
+
+def init_http_client(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Creates HTTP client shared by all image downloads.
+
+    :param app: current fastapi application.
+    """
+    app.state.image_downloader = ImageDownloader(
+        create_http_client(),
+        settings.http_max_connections_per_host,
+    )
+
+
+async def shutdown_http_client(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Closes connections of the HTTP client.
+
+    :param app: current FastAPI app.
+    """
+    await app.state.image_downloader.aclose()
@@ -2,7 +2,7 @@ import enum
 import os
 from pathlib import Path
 from tempfile import gettempdir
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import AnyHttpUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -73,6 +73,126 @@ class Settings(BaseSettings):
     ] = "https://2d8fe08755186f68c69cac3adc80c7b4@o1178736.ingest.us.sentry.io/4506857577447424"
     sentry_sample_rate: float = 1.0
 
+    # Segmentation backends, name -> class.
+    segmentation_backends: Dict[str, str] = {
+        "rembg": "background_changer.utils.segmentation.RembgBackend",
+        "bria_rmbg": "background_changer.utils.segmentation.BriaBackend",
+        "bria_rmbg_shadows": "background_changer.utils.segmentation.BriaShadowsBackend",
+        "transformers": "background_changer.utils.segmentation.TransformersBackend",
+    }
+    # Backends of the endpoints without a number, "2" and "3" endpoints.
+    segmentation_backend: str = "rembg"
+    segmentation_backend_2: str = "bria_rmbg"
+    segmentation_backend_3: str = "bria_rmbg_shadows"
+
+    # Segmentation models.
+    rembg_model: str = "u2net"
+    # rembg models requests can choose from, besides the default one.
+    rembg_models: List[str] = ["u2net", "u2netp", "isnet-general-use", "silueta"]
+    # Number of rembg models kept loaded, least recently used ones are unloaded.
+    rembg_max_models: int = 2
+    # rembg models unused for this many seconds are unloaded, 0 keeps them.
+    rembg_model_idle_seconds: float = 600
+    # Number of rembg segmentation passes, next passes segment the cutout again.
+    rembg_passes: int = 1
+    # Cleanup of rembg masks: drop alpha below threshold, erode and
+    # keep only the largest blob. 0/False disables a step.
+    mask_threshold: int = 10
+    mask_erode_size: int = 0
+    mask_keep_largest_component: bool = False
+    # Cutouts are cropped to alpha above the threshold, plus padding in pixels.
+    crop_alpha_threshold: int = 0
+    crop_padding: int = 0
+    # Number of pooled rembg sessions per worker, 0 derives it from the cores.
+    rembg_pool_size: int = 0
+    # onnxruntime threads of every pooled rembg session,
+    # 0 splits the cores of the worker between the sessions.
+    rembg_intra_op_threads: int = 0
+    rembg_inter_op_threads: int = 1
+    bria_model_name: str = "briaai/RMBG-1.4"
+    # Backend for BriaRMBG: "torch", "onnx" or "onnx_int8".
+    bria_backend: str = "torch"
+    # Directory for exported models.
+    model_cache_dir: Path = Path("models")
+    # 0 lets onnxruntime choose the number of threads.
+    onnx_intra_op_threads: int = 0
+    onnx_inter_op_threads: int = 0
+    # Minimal quality of int8 model masks compared to fp32 model.
+    quantization_min_iou: float = 0.95
+    quantization_max_mae: float = 0.02
+    # Load all registered models on startup instead of on first request.
+    preload_models: bool = False
+    # Fold BatchNorm into conv weights when the model is loaded.
+    fuse_batchnorm: bool = True
+    # Torch threads per worker, 0 splits available cores between workers.
+    torch_num_threads: int = 0
+    torch_interop_threads: int = 1
+    inference_channels_last: bool = False
+    # bf16 autocast, only worth it on CPUs with AVX512-BF16/AMX.
+    inference_bf16: bool = False
+    # Input resolutions of BriaRMBG, chosen per image or quality tier.
+    model_input_sizes: List[int] = [512, 768, 1024]
+    # Refine only the uncertain edge band of large images at tile resolution.
+    edge_refinement: bool = False
+    refine_tile_size: int = 512
+    # Alpha values between these thresholds are uncertain.
+    refine_low: int = 16
+    refine_high: int = 240
+    # Minimal share of uncertain pixels for a tile to be refined.
+    refine_min_fraction: float = 0.002
+    # Guided filter matting of the unknown band of the mask trimap, it's built
+    # with refine_low/refine_high and matting_band pixels wide on each side.
+    alpha_matting: bool = False
+    matting_band: int = 10
+    matting_radius: int = 8
+    matting_eps: float = 1e-4
+    matting_iterations: int = 3
+    matting_tile_size: int = 128
+    # Merge concurrent BriaRMBG requests into batched forward passes.
+    inference_batching: bool = False
+    inference_max_batch_size: int = 8
+    # How long the first request of a batch waits for others.
+    inference_max_wait_ms: float = 10.0
+    # Float model input buffers kept for reuse, 0 keeps inference_max_batch_size.
+    preprocess_buffers: int = 0
+    # Encoded images bigger than this are spooled to disk instead of memory.
+    in_memory_image_max_bytes: int = 64 * 1024 * 1024
+    # Memory limit of decoded backgrounds shared between requests.
+    background_cache_max_bytes: int = 512 * 1024 * 1024
+    # How long a background URL is trusted to point to the same image.
+    background_cache_url_ttl: float = 300
+    # Threads of a bulk change background job that decode, composite and
+    # encode images, 0 runs one per core. Images are segmented separately,
+    # as many at once as the segmentation backend segments.
+    bulk_workers: int = 0
+    # Shared HTTP client for image downloads.
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30
+    # Concurrent downloads from a single host.
+    http_max_connections_per_host: int = 10
+    # Needs the h2 package (httpx[http2]).
+    http_http2: bool = False
+    # Seconds, http_timeout applies to reads and writes.
+    http_timeout: float = 30
+    http_connect_timeout: float = 5
+    http_pool_timeout: float = 10
+    # Registered backgrounds, stored decoded and memory mapped by every worker.
+    background_library_dir: Path = Path("background_library")
+    # Backgrounds are also stored resized to these output widths.
+    background_plate_widths: List[int] = [1920, 1280]
+    # Largest output_width a request can ask for, backgrounds are upscaled to it.
+    max_output_width: int = 8192
+    # Detect the car with Faster R-CNN and segment only its padded box.
+    detector_roi: bool = False
+    detector_min_score: float = 0.5
+    # COCO labels of accepted boxes: car, bus and truck, empty accepts every box.
+    detector_labels: List[int] = [3, 6, 8]
+    # Longest side of the detector input.
+    detector_max_size: int = 1024
+    # Share of the box size added on every side of the ROI.
+    roi_padding: float = 0.1
+
     @property
     def db_url(self) -> URL:
         """
@@ -0,0 +1,48 @@
+import asyncio
+import io
+
+import numpy as np
+from PIL import Image
+
+from background_changer.utils.background_cache import BackgroundCache
+
+
+def _png(value: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (value, value, value)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_concurrent_fetches_download_once() -> None:
+    """Checks single flight loading and read-only cached arrays."""
+    cache = BackgroundCache(max_bytes=1024 * 1024, url_ttl=60)
+    downloads = []
+
+    async def download(url: str) -> bytes:  # noqa: WPS430
+        downloads.append(url)
+        await asyncio.sleep(0.01)
+        return _png(10)
+
+    async def fetch_all() -> list[np.ndarray]:  # noqa: WPS430
+        return await asyncio.gather(
+            *(cache.fetch("http://bg/1.png", download) for _ in range(5)),
+        )
+
+    arrays = asyncio.run(fetch_all())
+    again = asyncio.run(cache.fetch("http://bg/1.png", download))
+
+    assert len(downloads) == 1
+    assert all(array is arrays[0] for array in arrays)
+    assert again is arrays[0]
+    assert not again.flags.writeable
+
+
+def test_cache_is_memory_capped() -> None:
+    """Checks that least recently used backgrounds are evicted."""
+    cache = BackgroundCache(max_bytes=8 * 8 * 3 * 2, url_ttl=60)
+    first = cache.decode(_png(1))
+    second = cache.decode(_png(2))
+    assert cache.decode(_png(1)) is first
+    cache.decode(_png(3))
+    assert cache.decode(_png(1)) is first
+    assert cache.decode(_png(2)) is not second
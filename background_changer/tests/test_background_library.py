@@ -0,0 +1,65 @@
+import io
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+from pydantic import ValidationError
+
+from background_changer.settings import settings
+from background_changer.utils.background_library import BackgroundLibrary
+from background_changer.web.api.change_bg.schema import ChangeBgBackgroundInputDto
+
+
+def _png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (20, 120, 220)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_registered_backgrounds_are_mapped_plates(tmp_path: Path) -> None:
+    """Checks content IDs, pre-sized memory mapped plates and deletion."""
+    library = BackgroundLibrary(tmp_path, widths=[400, 100])
+    background_id = library.register(_png(200, 100))
+
+    assert library.register(io.BytesIO(_png(200, 100))) == background_id
+    assert library.plate_widths(background_id) == [200, 100]
+
+    original = library.plate(background_id)
+    plate = library.plate(background_id, 100)
+    assert isinstance(original, np.memmap)
+    assert isinstance(plate, np.memmap)
+    assert plate.shape == (50, 100, 3)
+    assert not plate.flags.writeable
+    assert library.plate(background_id, 50).shape == (25, 50, 3)
+
+    library.delete(background_id)
+    with pytest.raises(KeyError):
+        library.plate(background_id)
+
+
+def test_backgrounds_deleted_by_another_worker(tmp_path: Path) -> None:
+    """Checks that mapped plates aren't served once their files are gone."""
+    library = BackgroundLibrary(tmp_path, widths=[100])
+    background_id = library.register(_png(200, 100))
+    library.plate(background_id, 100)
+
+    # Another worker has no access to the cache of this one.
+    shutil.rmtree(tmp_path / background_id)
+
+    with pytest.raises(KeyError):
+        library.plate(background_id, 100)
+    with pytest.raises(KeyError):
+        library.plate(background_id)
+
+
+def test_output_width_is_limited() -> None:
+    """Checks that requests can't upscale backgrounds without a limit."""
+    background = {"background_id": "a" * 16}
+    ChangeBgBackgroundInputDto(**background, output_width=settings.max_output_width)
+    with pytest.raises(ValidationError):
+        ChangeBgBackgroundInputDto(
+            **background,
+            output_width=settings.max_output_width + 1,
+        )
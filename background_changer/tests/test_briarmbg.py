@@ -0,0 +1,46 @@
+import copy
+
+import torch
+
+from background_changer.utils.briarmbg import BriaRMBG
+
+
+def _random_model() -> BriaRMBG:
+    """
+    Creates BriaRMBG with non trivial BatchNorm statistics.
+
+    :return: model in eval mode.
+    """
+    torch.manual_seed(0)
+    model = BriaRMBG().eval()
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.2, 0.2)
+    return model
+
+
+def test_forward_mask_matches_forward() -> None:
+    """Tests that mask-only forward returns the primary side output."""
+    model = _random_model()
+    image = torch.randn(1, 3, 128, 128)
+    with torch.no_grad():
+        expected = model(image)[0][0]
+        mask = model.forward_mask(image)
+    assert torch.equal(mask, expected)
+
+
+def test_fused_model_gives_same_mask() -> None:
+    """Tests that folding BatchNorm into convs keeps the mask."""
+    model = _random_model()
+    fused = copy.deepcopy(model).fuse()
+    image = torch.randn(2, 3, 128, 128)
+    with torch.no_grad():
+        expected = model.forward_mask(image)
+        mask = fused.forward_mask(image)
+    assert not any(
+        isinstance(module, torch.nn.BatchNorm2d) for module in fused.modules()
+    )
+    assert torch.allclose(mask, expected, atol=1e-5)
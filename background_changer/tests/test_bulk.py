@@ -0,0 +1,116 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+
+from background_changer.utils import bulk, pipeline, segmentation
+from background_changer.utils.pipeline import (
+    change_background_array,
+    decode_image,
+    encode_image,
+)
+
+
+class _BoxBackend(segmentation.SegmentationBackend):
+    def __init__(self):
+        self.batches = []
+
+    def segment(self, image, quality=None, model=None):
+        alpha = np.zeros(image.shape[:2], dtype=np.uint8)
+        alpha[4:12, 4:20] = 255
+        return alpha
+
+    def segment_batch(self, images, quality=None, model=None):
+        self.batches.append(len(images))
+        return super().segment_batch(images, quality, model)
+
+    def parallel_segmentations(self):
+        return 2
+
+    def max_batch_size(self):
+        return 2
+
+
+def test_bulk_job_matches_single_images(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Checks that bulk results match single image results and failures are kept."""
+    backend = _BoxBackend()
+    monkeypatch.setattr(pipeline, "get_backend", lambda name: backend)
+    monkeypatch.setattr(bulk, "get_backend", lambda name: backend)
+    monkeypatch.setattr(bulk.settings, "bulk_workers", 3)
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (40, 60, 3), dtype=np.uint8)
+    background.flags.writeable = False
+    cars = [rng.integers(0, 255, (16, 24, 3), dtype=np.uint8) for _ in range(5)]
+    images = [
+        bulk.BulkImage(
+            file_name=str(index),
+            image=encode_image(car, "PNG"),
+            output_image_path=str(tmp_path / f"{index}.jpg"),
+        )
+        for index, car in enumerate(cars)
+    ]
+    images.append(bulk.BulkImage(file_name="broken", image=b"not an image"))
+
+    failed = bulk.change_backgrounds_bulk(
+        images,
+        background,
+        backend="box",
+    )
+
+    assert failed == ["broken"]
+    # Chunks of two images, the broken one is dropped before segmentation.
+    assert sorted(backend.batches) == [1, 2, 2]
+    for index, car in enumerate(cars):
+        expected = change_background_array(car, background, "box")
+        result = (tmp_path / f"{index}.jpg").read_bytes()
+        assert result == encode_image(expected)
+        assert decode_image(result).shape == background.shape
+
+
+def test_default_workers(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Checks that images are composited per core and segmented per backend."""
+    monkeypatch.setattr(bulk.settings, "bulk_workers", 0)
+    monkeypatch.setattr(bulk, "worker_cpu_count", lambda: 8)
+    assert bulk.bulk_worker_count(10) == 8
+    assert bulk.bulk_worker_count(1) == 1
+    assert bulk.segmentation_worker_count(_BoxBackend()) == 1
+
+    bria = segmentation.BriaBackend()
+    monkeypatch.setattr(segmentation.settings, "inference_max_batch_size", 4)
+    monkeypatch.setattr(segmentation.settings, "inference_batching", False)
+    assert bria.parallel_segmentations() == 1
+    assert bulk.segmentation_worker_count(bria) == 1
+    monkeypatch.setattr(segmentation.settings, "inference_batching", True)
+    assert bria.parallel_segmentations() == 4
+    assert bulk.segmentation_worker_count(bria) == 1
+
+
+def test_bria_batch_matches_single_images(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Checks that images of the same input size share one forward pass."""
+    batches = []
+
+    def forward(batch: torch.Tensor) -> torch.Tensor:
+        return batch.mean(dim=1, keepdim=True)
+
+    def run_bria_batch(batch: torch.Tensor) -> torch.Tensor:
+        batches.append(tuple(batch.shape))
+        return forward(batch)
+
+    monkeypatch.setattr(segmentation, "run_bria", forward)
+    monkeypatch.setattr(segmentation, "run_bria_batch", run_bria_batch)
+    rng = np.random.default_rng(0)
+    images = [
+        rng.integers(0, 255, shape, dtype=np.uint8)
+        for shape in [(100, 150, 3), (700, 600, 3), (120, 80, 3)]
+    ]
+    bria = segmentation.BriaBackend()
+
+    alphas = bria.segment_batch(images)
+
+    assert batches == [(2, 3, 512, 512), (1, 3, 768, 768)]
+    for image, alpha in zip(images, alphas):
+        assert np.array_equal(alpha, bria.segment(image))
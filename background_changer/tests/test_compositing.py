@@ -0,0 +1,30 @@
+import numpy as np
+
+from background_changer.utils.compositing import blend_into
+
+
+def test_blend_matches_float_blend() -> None:
+    """Checks the kernel against straight float blending."""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 256, (50, 60, 3), dtype=np.uint8)
+    foreground = rng.integers(0, 256, (20, 30, 3), dtype=np.uint8)
+    alpha = rng.integers(0, 256, (20, 30), dtype=np.uint8)
+    weight = alpha[:, :, np.newaxis] / 255
+    expected = background.astype(np.float64)
+    expected[10:30, 5:35] = expected[10:30, 5:35] * (1 - weight) + foreground * weight
+
+    blended = blend_into(background.copy(), foreground, alpha, 5, 10)
+
+    assert np.abs(blended - np.round(expected)).max() <= 1
+
+
+def test_blend_clips_foreground() -> None:
+    """Checks foregrounds that stick out of the background."""
+    background = np.zeros((10, 10, 3), dtype=np.uint8)
+    foreground = np.full((6, 6, 3), 255, dtype=np.uint8)
+    alpha = np.full((6, 6), 255, dtype=np.uint8)
+
+    blend_into(background, foreground, alpha, -2, 7)
+
+    assert background[7:, :4].min() == 255
+    assert background.sum() == 255 * 3 * 3 * 4
@@ -0,0 +1,26 @@
+import torch
+
+from background_changer.utils.rmbg3 import pad_box, select_largest_box
+
+
+def test_select_largest_box() -> None:
+    """Checks that small, unconfident and non vehicle boxes are skipped."""
+    boxes = torch.tensor(
+        [
+            [0, 0, 10, 10],
+            [0, 0, 50, 50],
+            [0, 0, 90, 90],
+            [0, 0, 20, 30],
+        ],
+        dtype=torch.float32,
+    )
+    scores = torch.tensor([0.9, 0.2, 0.9, 0.8])
+    labels = torch.tensor([3, 3, 1, 8])
+    box = select_largest_box(boxes, scores, labels)
+    assert box.tolist() == [0, 0, 20, 30]
+    assert select_largest_box(boxes, scores * 0, labels) is None
+
+
+def test_pad_box_is_clipped() -> None:
+    """Checks padding of a box near the image border."""
+    assert pad_box((10, 20, 110, 70), (100, 200), 0.2) == (0, 10, 130, 80)
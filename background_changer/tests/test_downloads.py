@@ -0,0 +1,81 @@
+import asyncio
+import io
+from pathlib import Path
+
+import httpx
+import pytest
+from PIL import Image
+
+from background_changer.utils import downloads
+from background_changer.utils.downloads import ImageDownloader
+
+
+@pytest.mark.anyio
+async def test_downloads_are_capped_per_host() -> None:
+    """Checks that one host gets at most ``max_per_host`` concurrent downloads."""
+    running = {"a.test": 0, "b.test": 0}
+    peak = {"a.test": 0, "b.test": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:  # noqa: WPS430
+        host = request.url.host
+        running[host] += 1
+        peak[host] = max(peak[host], running[host])
+        await asyncio.sleep(0.01)
+        running[host] -= 1
+        return httpx.Response(200, content=request.url.path.encode())
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    downloader = ImageDownloader(client, max_per_host=2)
+    urls = [f"http://{host}/{index}" for host in running for index in range(6)]
+    files = await downloader.fetch_all(urls)
+    await downloader.aclose()
+
+    assert [data.read() for data in files[:2]] == [b"/0", b"/1"]
+    assert peak == {"a.test": 2, "b.test": 2}
+    # Idle hosts don't keep their semaphores.
+    assert not downloader._hosts
+
+
+@pytest.mark.anyio
+async def test_png_is_saved_as_jpeg(tmp_path: Path) -> None:
+    """Checks that a downloaded RGBA PNG is converted and saved."""
+    png = io.BytesIO()
+    Image.new("RGBA", (8, 4), (10, 20, 30, 128)).save(png, "PNG")
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, content=png.getvalue()),
+        ),
+    )
+    downloader = ImageDownloader(client, max_per_host=1)
+    await downloader.fetch_and_save("http://a.test/car.png", str(tmp_path / "car.jpg"))
+    await downloader.aclose()
+
+    with Image.open(tmp_path / "car.jpg") as image:
+        assert (image.format, image.mode, image.size) == ("JPEG", "RGB", (8, 4))
+
+
+@pytest.mark.anyio
+async def test_failed_downloads_close_files(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Checks that no spooled file is left open when a download of a batch fails."""
+    files = []
+
+    def spooled_file() -> io.BytesIO:  # noqa: WPS430
+        data = io.BytesIO()
+        files.append(data)
+        return data
+
+    async def handler(request: httpx.Request) -> httpx.Response:  # noqa: WPS430
+        status = 404 if request.url.path == "/missing" else 200
+        return httpx.Response(status, content=b"image")
+
+    monkeypatch.setattr(downloads, "spooled_file", spooled_file)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    downloader = ImageDownloader(client, max_per_host=2)
+    with pytest.raises(httpx.HTTPStatusError):
+        await downloader.fetch_all(
+            ["http://a.test/0", "http://a.test/missing", "http://a.test/1"],
+        )
+    await downloader.aclose()
+
+    assert len(files) == 3
+    assert all(data.closed for data in files)
@@ -0,0 +1,44 @@
+import numpy as np
+from PIL import Image
+
+from background_changer.utils.masks import (
+    alpha_bbox,
+    cutout,
+    keep_largest_component,
+    soft_cutout,
+)
+
+
+def test_keep_largest_component() -> None:
+    """Checks that only the biggest blob is left in the mask."""
+    alpha = np.zeros((20, 20), dtype=np.uint8)
+    alpha[2:12, 2:12] = 255
+    alpha[15:18, 15:18] = 128
+    cleaned = keep_largest_component(alpha)
+    assert cleaned[2:12, 2:12].min() == 255
+    assert not cleaned[15:18, 15:18].any()
+
+
+def test_cutout_is_premultiplied() -> None:
+    """Checks color of a half transparent pixel."""
+    image = np.full((1, 1, 3), 200, dtype=np.uint8)
+    alpha = np.full((1, 1), 128, dtype=np.uint8)
+    assert cutout(image, alpha)[0, 0].tolist() == [100, 100, 100, 128]
+
+
+def test_soft_cutout_keeps_color() -> None:
+    """Checks that shadows keep the original color under soft alpha."""
+    image = np.full((2, 3, 3), 200, dtype=np.uint8)
+    alpha = np.full((2, 3), 64, dtype=np.uint8)
+    assert soft_cutout(image[:, 1:], alpha[:, 1:])[0, 0].tolist() == [200, 200, 200, 64]
+
+
+def test_alpha_bbox() -> None:
+    """Checks the box against PIL, the threshold and clipped padding."""
+    alpha = np.zeros((30, 40), dtype=np.uint8)
+    alpha[5:20, 8:30] = 255
+    alpha[25, 2] = 3
+    assert alpha_bbox(alpha) == Image.fromarray(alpha).getbbox()
+    assert alpha_bbox(alpha, threshold=3) == (8, 5, 30, 20)
+    assert alpha_bbox(alpha, threshold=3, padding=6) == (2, 0, 36, 26)
+    assert alpha_bbox(np.zeros_like(alpha)) is None
@@ -0,0 +1,38 @@
+import cv2
+import numpy as np
+
+from background_changer.utils.matting import UNKNOWN, build_trimap, matte
+
+
+def _edge_image() -> np.ndarray:
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    image[:, :32] = (200, 30, 30)
+    image[:, 32:] = (20, 40, 180)
+    return image
+
+
+def test_trimap_band() -> None:
+    """Checks that only pixels near the edge are unknown."""
+    alpha = np.zeros((64, 64), dtype=np.uint8)
+    alpha[:, :32] = 255
+    row = build_trimap(alpha, low=16, high=240, band=4)[10]
+    assert (row[:28] == 255).all()
+    assert (row[28:36] == UNKNOWN).all()
+    assert not row[36:].any()
+
+
+def test_matte_follows_color_edge() -> None:
+    """Checks that a misplaced soft edge moves to the color edge."""
+    alpha = np.zeros((64, 64), dtype=np.uint8)
+    alpha[:, :35] = 255
+    alpha = cv2.GaussianBlur(alpha, (0, 0), 2)
+    matted = matte(_edge_image(), alpha, tile_size=32)
+    assert (matted[:, 24:32] >= 245).all()
+    assert (matted[:, 32:36] < alpha[:, 32:36] // 2).all()
+    assert (matted[:, 48:] == 0).all()
+
+
+def test_matte_skips_solid_masks() -> None:
+    """Checks that masks without edges are returned as they are."""
+    alpha = np.full((64, 64), 255, dtype=np.uint8)
+    assert (matte(_edge_image(), alpha) == alpha).all()
@@ -0,0 +1,36 @@
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette import status
+
+from background_changer.settings import settings
+from background_changer.utils.segmentation import check_model_supported
+
+
+def test_only_rembg_has_model_variants() -> None:
+    """Checks that the model is rejected by backends without variants."""
+    check_model_supported("rembg", "u2netp")
+    check_model_supported(settings.segmentation_backend_2, None)
+    with pytest.raises(ValueError):
+        check_model_supported(settings.segmentation_backend_2, "u2netp")
+
+
+@pytest.mark.anyio
+async def test_bria_endpoint_rejects_rembg_model(
+    client: AsyncClient,
+    fastapi_app: FastAPI,
+) -> None:
+    """
+    Checks that a Bria backed endpoint answers 422 to ``rembg_model``.
+
+    :param client: client for the app.
+    :param fastapi_app: current FastAPI application.
+    """
+    url = fastapi_app.url_path_for("remove_background_and_return_file_2")
+    response = await client.post(
+        url,
+        params={"rembg_model": "u2netp"},
+        files={"image": ("car.jpg", b"", "image/jpeg")},
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert "model selection" in response.json()["detail"]
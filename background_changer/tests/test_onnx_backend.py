@@ -0,0 +1,30 @@
+from pathlib import Path
+
+import pytest
+import torch
+
+from background_changer.utils.briarmbg import BriaRMBG
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+from background_changer.utils.onnx_backend import (  # noqa: E402
+    OnnxBriaRMBG,
+    export_bria_rmbg,
+)
+
+
+def test_exported_model_matches_torch(tmp_path: Path) -> None:
+    """Checks the export is published atomically and matches torch masks."""
+    torch.manual_seed(0)
+    net = BriaRMBG().eval()
+    model_path = export_bria_rmbg(tmp_path / "bria.onnx", net, input_size=64)
+
+    assert [path.name for path in tmp_path.iterdir()] == ["bria.onnx"]
+    # Batch and spatial dimensions are dynamic.
+    image = torch.randn(2, 3, 96, 128)
+    with torch.no_grad():
+        expected = net.forward_mask(image)
+    mask = OnnxBriaRMBG(model_path).forward_mask(image)
+    assert mask.shape == expected.shape
+    assert torch.allclose(mask, expected, atol=1e-4)
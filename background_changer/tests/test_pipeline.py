@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from background_changer.utils import image_utils, pipeline
+from background_changer.utils.pipeline import (
+    change_background_bytes,
+    crop_to_alpha,
+    decode_image,
+    encode_image,
+)
+from background_changer.web.api.change_bg.schema import ChangeBgPositionModelInputDto
+
+
+class _SoftBoxBackend:
+    def segment(self, image, quality=None, model=None):
+        alpha = np.zeros(image.shape[:2], dtype=np.uint8)
+        alpha[8:40, 10:50] = 255
+        return cv2.GaussianBlur(alpha, (0, 0), 2)
+
+
+def test_crop_to_alpha() -> None:
+    """Checks that the crop is a view of the non transparent area."""
+    image = np.zeros((20, 30, 3), dtype=np.uint8)
+    alpha = np.zeros((20, 30), dtype=np.uint8)
+    alpha[5:8, 10:25] = 1
+    cropped, cropped_alpha = crop_to_alpha(image, alpha)
+    assert cropped.shape == (3, 15, 3)
+    assert cropped_alpha.shape == (3, 15)
+    assert np.shares_memory(cropped, image)
+
+
+def test_png_round_trip() -> None:
+    """Checks that encoding keeps RGB channel order."""
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+    image[:, :, 0] = 255
+    assert (decode_image(encode_image(image, "PNG")) == image).all()
+
+
+def test_in_memory_matches_file_pipeline(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Checks that the in-memory result is the JPEG of the file-based pipeline."""
+    backend = _SoftBoxBackend()
+    monkeypatch.setattr(pipeline, "get_backend", lambda name: backend)
+    monkeypatch.setattr(image_utils, "get_backend", lambda name: backend)
+    monkeypatch.setattr(image_utils, "delete_files", lambda *paths: None)
+    rng = np.random.default_rng(0)
+    car = encode_image(rng.integers(0, 255, (48, 64, 3), dtype=np.uint8), "PNG")
+    background = encode_image(
+        rng.integers(0, 255, (90, 120, 3), dtype=np.uint8),
+        "PNG",
+    )
+    (tmp_path / "car.png").write_bytes(car)
+    (tmp_path / "background.png").write_bytes(background)
+    position = ChangeBgPositionModelInputDto()
+
+    image_utils.change_background_image(
+        file_name="car",
+        image_path=str(tmp_path / "car.png"),
+        rm_image_path=str(tmp_path / "car_rmbg.png"),
+        background_image_path=str(tmp_path / "background.png"),
+        output_image_path=str(tmp_path / "car_chbg.jpg"),
+        position=position,
+    )
+    result = change_background_bytes(
+        car,
+        background,
+        "soft_box",
+        position.height_position,
+        position.width_position,
+        position.scale_factor,
+    )
+
+    assert result == (tmp_path / "car_chbg.jpg").read_bytes()
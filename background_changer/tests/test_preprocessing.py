@@ -0,0 +1,28 @@
+from contextlib import ExitStack
+
+import numpy as np
+import torch
+
+from background_changer.utils import preprocessing
+from background_changer.utils.preprocessing import input_buffer, preprocess_image
+
+
+def test_input_buffers_are_bounded() -> None:
+    """Checks that buffers are used exclusively and only a few are kept."""
+    max_free = preprocessing._free_buffers.maxsize
+    with ExitStack() as stack:
+        buffers = [stack.enter_context(input_buffer(8, 8)) for _ in range(max_free + 2)]
+        assert len({id(buffer) for buffer in buffers}) == len(buffers)
+    assert preprocessing._free_buffers.qsize() == max_free
+    with input_buffer(8, 8) as buffer:
+        assert any(buffer is kept for kept in buffers)
+
+
+def test_preprocess_into_buffer() -> None:
+    """Checks that writing into a pooled buffer gives the same input."""
+    image = np.random.default_rng(0).integers(0, 255, (20, 30, 3), dtype=np.uint8)
+    expected = preprocess_image(image, [16, 16])
+    with input_buffer(16, 16) as buffer:
+        tensor = preprocess_image(image, [16, 16], out=buffer)
+        assert tensor is buffer
+        assert torch.equal(tensor, expected)
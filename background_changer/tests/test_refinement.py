@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from background_changer.utils import segmentation
+from background_changer.utils.refinement import (
+    refine_edges,
+    select_tiles,
+    uncertain_band,
+)
+
+
+def _soft_edge(size: int = 256) -> np.ndarray:
+    alpha = np.zeros((size, size), dtype=np.uint8)
+    alpha[:, : size // 4] = 255
+    return cv2.GaussianBlur(alpha, (0, 0), 3)
+
+
+def test_uncertain_band() -> None:
+    """Checks that the thresholds are exclusive."""
+    alpha = np.array([[0, 16, 17, 239, 240, 255]], dtype=np.uint8)
+    assert uncertain_band(alpha, 16, 240).tolist() == [
+        [False, False, True, True, False, False],
+    ]
+
+
+def test_select_tiles() -> None:
+    """Checks that only tiles with enough band pixels are selected."""
+    band = np.zeros((100, 150), dtype=bool)
+    band[10:20, 60] = True
+    band[90, 140] = True
+    assert select_tiles(band, 64, 0).tolist() == [[0, 0], [1, 2]]
+    assert select_tiles(band, 64, 0.001).tolist() == [[0, 0]]
+
+
+def test_refine_edges_changes_only_band() -> None:
+    """Checks that solid areas of the coarse mask are kept."""
+    alpha = _soft_edge()
+    image = np.zeros((*alpha.shape, 3), dtype=np.uint8)
+    refined = refine_edges(
+        image,
+        alpha,
+        lambda tile: np.full(tile.shape[:2], 128, dtype=np.uint8),
+        tile_size=64,
+    )
+    changed = refined != alpha
+    band = uncertain_band(alpha, 16, 240)
+    assert changed.any()
+    assert (refined[changed] == 128).all()
+    assert band[changed].any()
+    assert not changed[:, 128:].any()
+    assert not changed[:, :40].any()
+
+
+def test_blank_tile_stays_background(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Checks that low contrast tiles are not stretched to foreground."""
+    coarse = torch.zeros(1, 1, 512, 512)
+    coarse[..., :128] = 1
+    coarse[..., 124:132] = torch.linspace(1, 0, 8)
+    calls = []
+
+    def run_bria(tensor: torch.Tensor) -> torch.Tensor:
+        calls.append(tensor.shape)
+        if len(calls) == 1:
+            return coarse
+        # The tile only sees background, with a little noise.
+        noise = torch.rand(1, 1, *tensor.shape[-2:])
+        return noise.mul_(0.01).add_(0.01)
+
+    monkeypatch.setattr(segmentation, "run_bria", run_bria)
+    image = np.zeros((1024, 1024, 3), dtype=np.uint8)
+    alpha = segmentation.segment_bria_refined(image)
+    assert len(calls) > 1
+    assert (alpha[:, :200] == 255).all()
+    assert alpha[:, 260:].max() <= 6
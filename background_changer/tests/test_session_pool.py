@@ -0,0 +1,45 @@
+import threading
+import time
+
+from background_changer.utils.session_pool import SessionPool, SessionPoolCache
+
+
+def test_sessions_are_not_shared() -> None:
+    """Checks that a session is never used by two callers at once."""
+    created = []
+    in_use = set()
+    errors = []
+
+    def factory() -> object:
+        session = object()
+        created.append(session)
+        return session
+
+    pool = SessionPool("test", factory, size=2)
+
+    def worker() -> None:
+        with pool.checkout() as session:
+            if session in in_use:
+                errors.append(session)
+            in_use.add(session)
+            time.sleep(0.01)
+            in_use.discard(session)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(created) == 2
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    """Checks that only ``max_models`` pools are kept."""
+    cache = SessionPoolCache(lambda name: SessionPool(name, object, 1), max_models=2)
+    first = cache.get("a")
+    cache.get("b")
+    assert cache.get("a") is first
+    cache.get("c")
+    assert cache.loaded() == ["a", "c"]
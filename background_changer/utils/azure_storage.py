@@ -11,19 +11,33 @@ account_key = settings.AZURE_STORAGE_ACCOUNT_ACCESS_KEY
 
 # Upload image to Azure Blob Storage
 def upload_image_to_blob_storage(image_path, image_name, container_name, content_type):
+    with open(image_path, "rb") as data:
+        return upload_bytes_to_blob_storage(
+            data,
+            image_name,
+            container_name,
+            content_type,
+        )
+
+
+def upload_bytes_to_blob_storage(data, image_name, container_name, content_type):
+    """
+    Uploads an encoded image without writing it to disk.
+
+    :param data: bytes or a file object.
+    :param image_name: name of the blob.
+    :param container_name: name of the container.
+    :param content_type: content type of the blob.
+    :return: URL of the blob.
+    """
     blob_service_client = BlobServiceClient(
         account_url=f"https://{account_name}.blob.core.windows.net",
         credential=account_key,
     )
     container_client = blob_service_client.get_container_client(container_name)
     blob_client = container_client.get_blob_client(image_name)
-    with open(image_path, "rb") as data:
-        blob_client.upload_blob(
-            data,
-        )
+    content_settings = None
     if content_type:
-        blob_client.set_http_headers(
-            content_settings=ContentSettings(content_type=content_type),
-        )
-    blob_client = container_client.get_blob_client(image_name)
+        content_settings = ContentSettings(content_type=content_type)
+    blob_client.upload_blob(data, content_settings=content_settings)
     return blob_client.url
@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Tuple
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge
+
+from background_changer.settings import settings
+
+from .pipeline import ImageSource, close_image, decode_image
+
+CACHE_REQUESTS = Counter(
+    "background_cache_requests",
+    "Lookups of decoded backgrounds.",
+    ["key", "result"],
+)
+CACHE_BYTES = Gauge(
+    "background_cache_bytes",
+    "Memory used by decoded backgrounds.",
+)
+
+
+def content_digest(source: ImageSource) -> str:
+    """
+    Hashes an encoded image.
+
+    :param source: encoded image or a file with it.
+    :return: hex sha256 of the content.
+    """
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(1024 * 1024), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+class BackgroundCache:
+    """
+    Memory capped LRU cache of decoded backgrounds.
+
+    Arrays are keyed by the hash of the encoded content, so the same
+    background is decoded once whatever URL or upload it comes from.
+    URLs are mapped to content hashes for ``url_ttl`` seconds, so repeated
+    requests with the same URL don't download it again. Concurrent
+    requests for a URL that is being loaded wait for the same download.
+
+    Cached arrays are read-only, callers composite into a copy.
+    """
+
+    def __init__(self, max_bytes: int, url_ttl: float) -> None:
+        self._max_bytes = max_bytes
+        self._url_ttl = url_ttl
+        self._arrays: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._urls: Dict[str, Tuple[str, float]] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def decode(self, source: ImageSource) -> np.ndarray:
+        """
+        Decodes an encoded background, reusing a cached array.
+
+        :param source: encoded image or a file with it.
+        :return: read-only RGB array.
+        """
+        return self._decode(content_digest(source), source)
+
+    async def fetch(
+        self,
+        url: str,
+        download: Callable[[str], Awaitable[ImageSource]],
+    ) -> np.ndarray:
+        """
+        Returns decoded background of a URL.
+
+        :param url: URL of the background.
+        :param download: coroutine function that downloads a URL.
+        :return: read-only RGB array.
+        """
+        with self._lock:
+            digest, expires = self._urls.get(url, (None, 0.0))
+            array = self._arrays.get(digest) if expires > time.monotonic() else None
+            if array is not None:
+                self._arrays.move_to_end(digest)
+        CACHE_REQUESTS.labels("url", "miss" if array is None else "hit").inc()
+        if array is not None:
+            return array
+        task = self._loading.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._load(url, download))
+            self._loading[url] = task
+            task.add_done_callback(lambda _: self._loading.pop(url, None))
+        # Cancelling one of the waiting requests mustn't cancel the download.
+        return await asyncio.shield(task)
+
+    def clear(self) -> None:
+        """Drops every cached background."""
+        with self._lock:
+            self._arrays.clear()
+            self._urls.clear()
+            self._size = 0
+        CACHE_BYTES.set(0)
+
+    async def _load(
+        self,
+        url: str,
+        download: Callable[[str], Awaitable[ImageSource]],
+    ) -> np.ndarray:
+        source = await download(url)
+        try:
+            digest = await run_in_threadpool(content_digest, source)
+            array = await run_in_threadpool(self._decode, digest, source)
+        finally:
+            close_image(source)
+        now = time.monotonic()
+        with self._lock:
+            self._urls = {
+                cached_url: entry
+                for cached_url, entry in self._urls.items()
+                if entry[1] > now
+            }
+            self._urls[url] = (digest, now + self._url_ttl)
+        return array
+
+    def _decode(self, digest: str, source: ImageSource) -> np.ndarray:
+        with self._lock:
+            array = self._arrays.get(digest)
+            if array is not None:
+                self._arrays.move_to_end(digest)
+        CACHE_REQUESTS.labels("content", "miss" if array is None else "hit").inc()
+        if array is not None:
+            return array
+        array = decode_image(source)
+        array.flags.writeable = False
+        self._put(digest, array)
+        return array
+
+    def _put(self, digest: str, array: np.ndarray) -> None:
+        if array.nbytes > self._max_bytes:
+            return
+        with self._lock:
+            if digest not in self._arrays:
+                self._arrays[digest] = array
+                self._size += array.nbytes
+            while self._size > self._max_bytes:
+                _, evicted = self._arrays.popitem(last=False)
+                self._size -= evicted.nbytes
+            size = self._size
+        CACHE_BYTES.set(size)
+
+
+background_cache = BackgroundCache(
+    settings.background_cache_max_bytes,
+    settings.background_cache_url_ttl,
+)
@@ -0,0 +1,173 @@
+import shutil
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from background_changer.settings import settings
+
+from .background_cache import content_digest
+from .pipeline import ImageSource, decode_image
+
+BACKGROUND_ID_PATTERN = r"^[0-9a-f]{16}$"
+ORIGINAL = "original"
+
+
+def resize_to_width(image: np.ndarray, width: int) -> np.ndarray:
+    """
+    Resizes an image to a width keeping its aspect ratio.
+
+    :param image: image of shape (H, W, C).
+    :param width: target width.
+    :return: resized image, the same array if the width matches.
+    """
+    height, current_width = image.shape[:2]
+    if width == current_width:
+        return image
+    interpolation = cv2.INTER_AREA if width < current_width else cv2.INTER_LINEAR
+    return cv2.resize(
+        image,
+        (width, max(1, round(height * width / current_width))),
+        interpolation=interpolation,
+    )
+
+
+@lru_cache(maxsize=256)
+def _map_plate(path: Path, mtime_ns: int) -> np.ndarray:
+    # Pages of a memory mapped file are shared by every worker process.
+    return np.load(path, mmap_mode="r")
+
+
+def _load_plate(path: Path) -> Optional[np.ndarray]:
+    # Plates are deleted by whichever worker handles the request, so the file
+    # is checked on every hit. The modification time is a part of the key,
+    # so a background deleted and registered again is mapped again.
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _map_plate(path, mtime_ns)
+
+
+class BackgroundLibrary:
+    """
+    Backgrounds registered once and referenced by ID.
+
+    Every background is decoded once and stored as raw ``.npy`` plates:
+    the original and a copy for each of ``widths`` smaller than it.
+    Plates are memory mapped read-only, so all uvicorn workers share
+    the same page cache instead of holding their own decoded copies.
+    IDs are derived from the content, so registering the same background
+    twice returns the same ID.
+    """
+
+    def __init__(self, root: Path, widths: List[int]) -> None:
+        self.root = root
+        self.widths = sorted(set(widths), reverse=True)
+
+    def register(self, source: ImageSource) -> str:
+        """
+        Decodes a background and stores its plates.
+
+        :param source: encoded background.
+        :return: ID of the background.
+        """
+        background_id = content_digest(source)[:16]
+        if not self.exists(background_id):
+            self._store(background_id, decode_image(source))
+            logger.info(f"Registered background {background_id}")
+        return background_id
+
+    def exists(self, background_id: str) -> bool:
+        """
+        Checks whether a background is registered.
+
+        :param background_id: ID of the background.
+        :return: True if it's registered.
+        """
+        return (self.root / background_id / f"{ORIGINAL}.npy").exists()
+
+    def plate_widths(self, background_id: str) -> List[int]:
+        """
+        Widths of the stored plates of a background.
+
+        :param background_id: ID of the background.
+        :return: widths, the original width first.
+        """
+        original = self.plate(background_id)
+        return [original.shape[1]] + [
+            width
+            for width in self.widths
+            if (self.root / background_id / f"{width}.npy").exists()
+        ]
+
+    def plate(self, background_id: str, width: Optional[int] = None) -> np.ndarray:
+        """
+        Returns a read-only background of the requested width.
+
+        Stored plates are memory mapped, other widths are resized
+        from the original.
+
+        :param background_id: ID of the background.
+        :param width: output width, the original one if not set.
+        :raises KeyError: if background is not registered.
+        :return: RGB array.
+        """
+        directory = self.root / background_id
+        plate = _load_plate(directory / f"{width}.npy") if width else None
+        if plate is not None:
+            return plate
+        original = _load_plate(directory / f"{ORIGINAL}.npy")
+        if original is None:
+            raise KeyError(f"Background {background_id!r} is not registered")
+        return resize_to_width(original, width) if width else original
+
+    def delete(self, background_id: str) -> None:
+        """
+        Removes a background.
+
+        Other workers stop serving it on the next request, their mappings
+        of the deleted files are released when they are evicted.
+
+        :param background_id: ID of the background.
+        :raises KeyError: if background is not registered.
+        """
+        if not self.exists(background_id):
+            raise KeyError(f"Background {background_id!r} is not registered")
+        shutil.rmtree(self.root / background_id)
+        _map_plate.cache_clear()
+
+    def _store(self, background_id: str, image: np.ndarray) -> None:
+        """
+        Saves plates into a staging directory and moves it into place.
+
+        The rename is atomic, so other workers never see a partial
+        background. Losing a race with a worker that registered the same
+        background is not an error.
+
+        :param background_id: ID of the background.
+        :param image: decoded background.
+        :raises OSError: if the plates can't be saved.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=self.root, prefix=".tmp-"))
+        try:
+            np.save(staging / f"{ORIGINAL}.npy", image)
+            for width in self.widths:
+                if width < image.shape[1]:
+                    np.save(staging / f"{width}.npy", resize_to_width(image, width))
+            staging.rename(self.root / background_id)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            if not self.exists(background_id):
+                raise
+
+
+background_library = BackgroundLibrary(
+    settings.background_library_dir,
+    settings.background_plate_widths,
+)
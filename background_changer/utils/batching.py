@@ -0,0 +1,178 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+from loguru import logger
+from prometheus_client import Histogram
+
+from background_changer.settings import settings
+
+from .inference import inference_context, prepare_input
+from .model_registry import BRIA_RMBG, model_registry
+
+BATCH_SIZE = Histogram(
+    "inference_batch_size",
+    "Number of images in a single batched forward pass.",
+    ["model"],
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+QUEUE_WAIT = Histogram(
+    "inference_queue_wait_seconds",
+    "Time a request spent waiting for its batch to start.",
+    ["model"],
+    buckets=(0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+
+@dataclass
+class _PendingRequest:
+    tensor: torch.Tensor
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class BatchingEngine:
+    """
+    Dynamic micro-batching for a model forward pass.
+
+    Callers submit single-image tensors from any thread.
+    A background thread collects requests for up to ``max_wait_ms``
+    (or until ``max_batch_size`` requests are pending),
+    runs them as one batch and routes every output row
+    back to the caller that submitted it.
+
+    Only tensors of the same shape can share a batch,
+    requests with different shapes are run as separate batches.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        forward: Callable[[torch.Tensor], torch.Tensor],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+    ) -> None:
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._forward = forward
+        self._queue: "queue.Queue[_PendingRequest]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, tensor: torch.Tensor) -> "Future[torch.Tensor]":
+        """
+        Queues a tensor for inference.
+
+        :param tensor: input of shape (1, C, H, W).
+        :returns: future with the output of shape (1, ...).
+        """
+        self._ensure_started()
+        request = _PendingRequest(tensor=tensor)
+        self._queue.put(request)
+        return request.future
+
+    def infer(self, tensor: torch.Tensor) -> torch.Tensor:
+        """
+        Runs inference for a single tensor and waits for the result.
+
+        :param tensor: input of shape (1, C, H, W).
+        :returns: output of shape (1, ...).
+        """
+        return self.submit(tensor).result()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"{self.name}-batching",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _collect(self) -> List[_PendingRequest]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:  # noqa: WPS457
+            groups: Dict[Tuple[int, ...], List[_PendingRequest]] = {}
+            for request in self._collect():
+                groups.setdefault(tuple(request.tensor.shape[1:]), []).append(request)
+            for requests in groups.values():
+                self._run_batch(requests)
+
+    def _run_batch(self, requests: List[_PendingRequest]) -> None:
+        started = time.perf_counter()
+        for request in requests:
+            QUEUE_WAIT.labels(self.name).observe(started - request.enqueued_at)
+        BATCH_SIZE.labels(self.name).observe(len(requests))
+        try:
+            with inference_context():
+                outputs = self._forward(torch.cat([req.tensor for req in requests]))
+        except Exception as exc:
+            logger.exception(f"Batched inference of {self.name} failed")
+            for failed in requests:
+                failed.future.set_exception(exc)
+            return
+        for index, request in enumerate(requests):
+            request.future.set_result(outputs[index : index + 1])
+
+
+def _bria_forward(batch: torch.Tensor) -> torch.Tensor:
+    return model_registry.get(BRIA_RMBG).forward_mask(prepare_input(batch)).float()
+
+
+bria_engine = BatchingEngine(
+    BRIA_RMBG,
+    _bria_forward,
+    max_batch_size=settings.inference_max_batch_size,
+    max_wait_ms=settings.inference_max_wait_ms,
+)
+
+
+def run_bria(image: torch.Tensor) -> torch.Tensor:
+    """
+    Computes BriaRMBG mask for a single preprocessed image.
+
+    When batching is enabled the request is merged with
+    other concurrent requests into one forward pass.
+
+    :param image: input of shape (1, 3, H, W).
+    :returns: mask of shape (1, 1, H, W).
+    """
+    if settings.inference_batching:
+        return bria_engine.infer(image)
+    with inference_context():
+        return _bria_forward(image)
+
+
+def run_bria_batch(batch: torch.Tensor) -> torch.Tensor:
+    """
+    Computes BriaRMBG masks for a batch collected by the caller.
+
+    The batch bypasses the batching engine and is run
+    as a single forward pass.
+
+    :param batch: input of shape (N, 3, H, W).
+    :returns: masks of shape (N, 1, H, W).
+    """
+    BATCH_SIZE.labels(BRIA_RMBG).observe(len(batch))
+    with inference_context():
+        return _bria_forward(batch)
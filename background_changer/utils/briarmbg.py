@@ -2,6 +2,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from huggingface_hub import PyTorchModelHubMixin
+from torch.ao.quantization import fuse_modules
 
 
 class REBNCONV(nn.Module):
@@ -391,7 +392,7 @@ class BriaRMBG(nn.Module, PyTorchModelHubMixin):
 
         # self.outconv = nn.Conv2d(6*out_ch,out_ch,1)
 
-    def forward(self, x):
+    def _features(self, x):
         hx = x
 
         hxin = self.conv_in(hx)
@@ -436,6 +437,11 @@ class BriaRMBG(nn.Module, PyTorchModelHubMixin):
 
         hx1d = self.stage1d(torch.cat((hx2dup, hx1), 1))
 
+        return hx1d, hx2d, hx3d, hx4d, hx5d, hx6
+
+    def forward(self, x):
+        hx1d, hx2d, hx3d, hx4d, hx5d, hx6 = self._features(x)
+
         # side output
         d1 = self.side1(hx1d)
         d1 = _upsample_like(d1, x)
@@ -463,3 +469,25 @@ class BriaRMBG(nn.Module, PyTorchModelHubMixin):
             F.sigmoid(d5),
             F.sigmoid(d6),
         ], [hx1d, hx2d, hx3d, hx4d, hx5d, hx6]
+
+    def forward_mask(self, x):
+        # inference only: computes and upsamples just the primary side output,
+        # the other side outputs are only used as deep supervision in training
+        hx1d = self._features(x)[0]
+
+        d1 = self.side1(hx1d)
+        d1 = _upsample_like(d1, x)
+
+        return F.sigmoid(d1)
+
+    def fuse(self):
+        # fold BatchNorm into the preceding conv (and conv+relu into ConvReLU2d)
+        # for every REBNCONV/myrebnconv block, only valid in eval mode
+        blocks = [m for m in self.modules() if isinstance(m, (REBNCONV, myrebnconv))]
+        for block in blocks:
+            if isinstance(block, REBNCONV):
+                fuse_modules(block, [["conv_s1", "bn_s1", "relu_s1"]], inplace=True)
+            else:
+                fuse_modules(block, [["conv", "bn", "rl"]], inplace=True)
+
+        return self
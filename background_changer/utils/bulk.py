@@ -0,0 +1,245 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, List, Optional, Set, Tuple
+
+import numpy as np
+from loguru import logger
+from prometheus_client import Counter
+
+from background_changer.settings import settings
+
+from .inference import worker_cpu_count
+from .pipeline import (
+    ImageInput,
+    ImageSource,
+    close_image,
+    composite_car,
+    decode_image,
+    encode_image,
+    store_result,
+)
+from .resolution import QualityTier
+from .segmentation import SegmentationBackend, get_backend, segment_images
+
+BULK_IMAGES = Counter(
+    "bulk_change_background_images",
+    "Images processed by bulk change background jobs.",
+    ["result"],
+)
+
+
+@dataclass
+class BulkImage:
+    """Foreground of a bulk change background job."""
+
+    file_name: str
+    image: ImageSource
+    output_image_path: Optional[str] = None
+
+
+# Index of an image in the job and the image.
+_Entry = Tuple[int, BulkImage]
+
+
+def bulk_worker_count(images: int) -> int:
+    """
+    Number of threads of a bulk job that decode, composite and encode images.
+
+    These stages run in numpy, OpenCV and PIL, which release the GIL,
+    so by default the job runs one thread per core of the worker.
+
+    :param images: number of images in the job.
+    :return: ``bulk_workers`` or the cores of the worker,
+        at most one per image.
+    """
+    return max(1, min(images, settings.bulk_workers or worker_cpu_count()))
+
+
+def segmentation_worker_count(backend: SegmentationBackend) -> int:
+    """
+    Number of threads of a bulk job that segment images.
+
+    Every segmentation already runs on the intra-op threads of its
+    inference session, so the job segments only as many images at once
+    as the backend does. A thread passes up to
+    :meth:`SegmentationBackend.max_batch_size` images to the backend
+    at once, which BriaRMBG runs as a single forward pass.
+
+    :param backend: segmentation backend of the job.
+    :return: number of threads.
+    """
+    return max(1, backend.parallel_segmentations() // backend.max_batch_size())
+
+
+def change_backgrounds_bulk(
+    images: List[BulkImage],
+    background: ImageInput,
+    height_position: float = 0.69,
+    width_position: float = 0.5,
+    scale_factor: float = 0.62,
+    container_name: Optional[str] = None,
+    backend: Optional[str] = None,
+    quality: Optional[QualityTier] = None,
+    rembg_model: Optional[str] = None,
+    preserve_shadows: bool = False,
+) -> List[str]:
+    """
+    Places the cars of many images on the same background.
+
+    The background is decoded once and shared read-only by all images.
+    Images are split into chunks of the batch size of the backend.
+    Chunks are segmented by :func:`segmentation_worker_count` threads,
+    every chunk with one call of the backend, while a pool of
+    :func:`bulk_worker_count` threads decodes the next chunks and
+    composites, encodes and stores the segmented images.
+    Every compositing thread reuses its own frame, so the job
+    allocates one frame per thread instead of one per image.
+
+    :param images: images with the cars, files are closed once decoded.
+    :param background: encoded or decoded background.
+    :param height_position: vertical position of the cars in [0, 1].
+    :param width_position: horizontal position of the cars in [0, 1].
+    :param scale_factor: car width relative to the background width.
+    :param container_name: blob container to upload the results to.
+    :param backend: segmentation backend, ``segmentation_backend`` if not set.
+    :param quality: requested quality tier.
+    :param rembg_model: requested rembg model.
+    :param preserve_shadows: segment with ``segmentation_backend_3``
+        and keep soft shadows on the background.
+    :return: file names of the images that failed.
+    """
+    if not isinstance(background, np.ndarray):
+        background = decode_image(background)
+    if preserve_shadows:
+        backend = settings.segmentation_backend_3
+    segmentation = get_backend(backend or settings.segmentation_backend)
+    workers = bulk_worker_count(len(images))
+    batch_size = segmentation.max_batch_size()
+    entries = list(enumerate(images))
+    with ThreadPoolExecutor(
+        max_workers=workers,
+        thread_name_prefix="bulk-change-bg",
+    ) as cpu:
+        job = _BulkJob(
+            cpu,
+            frames=[np.empty_like(background) for _ in range(workers)],
+            segment=partial(
+                segment_images,
+                segmentation,
+                quality=quality,
+                model=rembg_model,
+            ),
+            render=partial(
+                composite_car,
+                background=background,
+                height_position=height_position,
+                width_position=width_position,
+                scale_factor=scale_factor,
+                preserve_shadows=preserve_shadows,
+            ),
+            container_name=container_name,
+        )
+        with ThreadPoolExecutor(
+            max_workers=segmentation_worker_count(segmentation),
+            thread_name_prefix="bulk-segment",
+        ) as segmenters:
+            list(
+                segmenters.map(
+                    job.run_chunk,
+                    [
+                        entries[start : start + batch_size]
+                        for start in range(0, len(entries), batch_size)
+                    ],
+                ),
+            )
+    return [item.file_name for index, item in entries if index in job.failed]
+
+
+class _BulkJob:
+    """
+    Stages of a bulk job shared by its threads.
+
+    Segmentation threads hand segmented images over to the compositing
+    pool, at most two per compositing thread wait there, so decoded
+    images don't pile up when compositing is slower than segmentation.
+    """
+
+    def __init__(
+        self,
+        cpu: ThreadPoolExecutor,
+        frames: List[np.ndarray],
+        segment: Callable[[List[np.ndarray]], List[np.ndarray]],
+        render: Callable[..., np.ndarray],
+        container_name: Optional[str],
+    ) -> None:
+        self.cpu = cpu
+        self.segment = segment
+        self.render = render
+        self.container_name = container_name
+        self.failed: Set[int] = set()
+        self._frames: "queue.SimpleQueue[np.ndarray]" = queue.SimpleQueue()
+        for frame in frames:
+            self._frames.put(frame)
+        self._pending = threading.Semaphore(2 * len(frames))
+
+    def run_chunk(self, chunk: List[_Entry]) -> None:
+        """
+        Decodes and segments a chunk and queues its images for compositing.
+
+        :param chunk: images segmented with one call of the backend.
+        """
+        decoded = [
+            (entry, image)
+            for entry, image in zip(chunk, self.cpu.map(self._decode, chunk))
+            if image is not None
+        ]
+        if not decoded:
+            return
+        try:
+            alphas = self.segment([image for _, image in decoded])
+        except Exception:
+            logger.exception(f"Failed to segment {len(decoded)} images of a bulk job")
+            for (index, _), _ in decoded:
+                self._fail(index)
+            return
+        for (entry, image), alpha in zip(decoded, alphas):
+            self._pending.acquire()
+            self.cpu.submit(self._composite, entry, image, alpha)
+
+    def _decode(self, entry: _Entry) -> Optional[np.ndarray]:
+        index, item = entry
+        try:
+            return decode_image(item.image)
+        except Exception:
+            logger.exception(f"Failed to decode {item.file_name}")
+            self._fail(index)
+            return None
+        finally:
+            close_image(item.image)
+
+    def _composite(self, entry: _Entry, image: np.ndarray, alpha: np.ndarray) -> None:
+        index, item = entry
+        frame = self._frames.get()
+        try:
+            result = self.render(image, alpha, out=frame)
+            store_result(
+                encode_image(result),
+                item.file_name,
+                self.container_name,
+                item.output_image_path,
+            )
+        except Exception:
+            logger.exception(f"Failed to change background of {item.file_name}")
+            self._fail(index)
+            return
+        finally:
+            self._frames.put(frame)
+            self._pending.release()
+        BULK_IMAGES.labels("ok").inc()
+
+    def _fail(self, index: int) -> None:
+        self.failed.add(index)
+        BULK_IMAGES.labels("failed").inc()
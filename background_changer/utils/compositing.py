@@ -0,0 +1,75 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+Region = Tuple[slice, slice]
+
+
+def overlap(
+    background_size: Tuple[int, int],
+    foreground_size: Tuple[int, int],
+    x: int,
+    y: int,
+) -> Optional[Tuple[Region, Region]]:
+    """
+    Finds the visible part of a foreground placed on a background.
+
+    :param background_size: (height, width) of the background.
+    :param foreground_size: (height, width) of the foreground.
+    :param x: left offset of the foreground, may be negative.
+    :param y: top offset of the foreground, may be negative.
+    :return: background and foreground regions or None if they don't overlap.
+    """
+    bg_height, bg_width = background_size
+    fg_height, fg_width = foreground_size
+    left, top = max(x, 0), max(y, 0)
+    right, bottom = min(x + fg_width, bg_width), min(y + fg_height, bg_height)
+    if left >= right or top >= bottom:
+        return None
+    return (
+        (slice(top, bottom), slice(left, right)),
+        (slice(top - y, bottom - y), slice(left - x, right - x)),
+    )
+
+
+def blend_into(
+    background: np.ndarray,
+    foreground: np.ndarray,
+    alpha: np.ndarray,
+    x: int = 0,
+    y: int = 0,
+) -> np.ndarray:
+    """
+    Alpha blends a foreground into the background in place.
+
+    All channels are blended at once with float32 per-pixel weights,
+    ``fg * a + bg * (1 - a)`` rounded to uint8, by a single
+    ``cv2.blendLinear`` pass that writes straight into the background ROI.
+    The parts of the foreground that are outside of the background
+    are clipped.
+
+    :param background: uint8 image of shape (H, W, C), modified in place.
+    :param foreground: uint8 image of shape (h, w, C).
+    :param alpha: uint8 alpha of shape (h, w).
+    :param x: left offset of the foreground, may be negative.
+    :param y: top offset of the foreground, may be negative.
+    :return: the background.
+    """
+    regions = overlap(background.shape[:2], foreground.shape[:2], x, y)
+    if regions is None:
+        return background
+    bg_region, fg_region = regions
+    roi = background[bg_region]
+    weight = alpha[fg_region].astype(np.float32)
+    weight *= 1 / 255
+    blended = cv2.blendLinear(
+        np.ascontiguousarray(foreground[fg_region]),
+        roi,
+        weight,
+        1 - weight,
+        dst=roi,
+    )
+    if not np.shares_memory(blended, roi):
+        roi[...] = blended
+    return background
@@ -0,0 +1,157 @@
+import asyncio
+import io
+from contextlib import asynccontextmanager
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, Dict, List, Sequence
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+
+from background_changer.settings import settings
+
+from .pipeline import spooled_file
+
+
+def save_image(content: bytes, path: str, img_format: str = "JPEG") -> None:
+    """
+    Saves an encoded image in another format.
+
+    :param content: encoded image.
+    :param path: path to save the image to.
+    :param img_format: format of the saved image.
+    """
+    with Image.open(io.BytesIO(content)) as image:
+        # Check if the image is PNG
+        if image.format == "PNG":
+            # Convert to JPEG
+            image = image.convert("RGB")
+        image.save(path, format=img_format)
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Creates HTTP client for image downloads.
+
+    Connections are pooled and kept alive, so downloads from
+    the same host reuse TCP and TLS connections.
+
+    :return: client configured with ``http_*`` settings.
+    """
+    return httpx.AsyncClient(
+        http2=settings.http_http2,
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            settings.http_timeout,
+            connect=settings.http_connect_timeout,
+            pool=settings.http_pool_timeout,
+        ),
+        follow_redirects=True,
+    )
+
+
+class ImageDownloader:
+    """
+    Downloads images with a shared HTTP client.
+
+    Besides the connection limits of the client, at most
+    ``max_per_host`` downloads from the same host run at once,
+    so a bulk request doesn't take every connection of the pool.
+    Semaphores are only kept for hosts with running or waiting downloads.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, max_per_host: int) -> None:
+        self.client = client
+        self.max_per_host = max_per_host
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._host_users: Dict[str, int] = {}
+
+    async def fetch(self, url: str) -> SpooledTemporaryFile:
+        """
+        Downloads an image without decoding it.
+
+        :param url: URL of the image.
+        :return: encoded image, kept in memory unless it's too big.
+        """
+        data = spooled_file()
+        try:
+            async with self._host_slot(url):
+                async with self.client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes():
+                        data.write(chunk)
+        except BaseException:
+            # Also on cancellation, a part of the image may be spooled to disk.
+            data.close()
+            raise
+        data.seek(0)
+        return data
+
+    async def fetch_all(self, urls: Sequence[str]) -> List[SpooledTemporaryFile]:
+        """
+        Downloads images concurrently.
+
+        All downloads are started at once, the client pool
+        and ``max_per_host`` limit how many of them run.
+
+        :param urls: URLs of the images.
+        :raises BaseException: the first error of the downloads,
+            images downloaded by the others are closed.
+        :return: encoded images in the order of the URLs.
+        """
+        results = await asyncio.gather(
+            *(self.fetch(url) for url in urls),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            for result in results:
+                if not isinstance(result, BaseException):
+                    result.close()
+            raise errors[0]
+        return results  # type: ignore
+
+    async def fetch_and_save(
+        self,
+        url: str,
+        path: str,
+        img_format: str = "JPEG",
+    ) -> None:
+        """
+        Downloads an image and saves it in another format.
+
+        Decoding and encoding run in the thread pool,
+        so they don't block the event loop.
+
+        :param url: URL of the image.
+        :param path: path to save the image to.
+        :param img_format: format of the saved image.
+        """
+        async with self._host_slot(url):
+            response = await self.client.get(url)
+            response.raise_for_status()
+        await run_in_threadpool(save_image, response.content, path, img_format)
+
+    async def aclose(self) -> None:
+        """Closes connections of the client."""
+        await self.client.aclose()
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str) -> AsyncIterator[None]:
+        host = httpx.URL(url).host
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.max_per_host)
+            self._host_users[host] = 0
+        self._host_users[host] += 1
+        try:
+            async with self._hosts[host]:
+                yield
+        finally:
+            self._host_users[host] -= 1
+            if not self._host_users[host]:
+                del self._hosts[host]
+                del self._host_users[host]
@@ -1,45 +1,27 @@
 import os
 import uuid
 from datetime import datetime
+from typing import Optional
 
 import cv2
 import numpy as np
-import torch
-import torch.nn.functional as F
-from PIL import Image
-from rembg import new_session, remove
-from skimage import io
-from torchvision.transforms.functional import normalize
+from PIL import Image, ImageOps
 
+from background_changer.settings import settings
 from background_changer.utils.azure_storage import upload_image_to_blob_storage
 from background_changer.web.api.change_bg.schema import ChangeBgPositionModelInputDto
 
-from .briarmbg import BriaRMBG
-
-
-def preprocess_image(im: np.ndarray, model_input_size: list) -> torch.Tensor:
-    if len(im.shape) < 3:
-        im = im[:, :, np.newaxis]
-    # orig_im_size=im.shape[0:2]
-    im_tensor = torch.tensor(im, dtype=torch.float32).permute(2, 0, 1)
-    im_tensor = F.interpolate(
-        torch.unsqueeze(im_tensor, 0),
-        size=model_input_size,
-        mode="bilinear",
-    ).type(torch.uint8)
-    image = torch.divide(im_tensor, 255.0)
-    image = normalize(image, [0.5, 0.5, 0.5], [1.0, 1.0, 1.0])
-    return image
-
-
-def postprocess_image(result: torch.Tensor, im_size: list) -> np.ndarray:
-    result = torch.squeeze(F.interpolate(result, size=im_size, mode="bilinear"), 0)
-    ma = torch.max(result)
-    mi = torch.min(result)
-    result = (result - mi) / (ma - mi)
-    im_array = (result * 255).permute(1, 2, 0).cpu().data.numpy().astype(np.uint8)
-    im_array = np.squeeze(im_array)
-    return im_array
+from .compositing import blend_into
+from .masks import cutout, soft_cutout
+from .pipeline import (
+    ImageInput,
+    ImageSource,
+    change_background_bytes,
+    crop_to_alpha,
+    store_result,
+)
+from .resolution import QualityTier
+from .segmentation import get_backend, segment_image
 
 
 def delete_files(*args):
@@ -80,37 +62,72 @@ def add_car_to_background(
     x_offset = int(width_position * (background_width - car_width))
     y_offset = int(height_position * (background_height - car_height))
 
-    mask = car_resized[:, :, 3] / 255.0
-
-    for c in range(3):
-        background[
-            y_offset : y_offset + car_resized.shape[0],
-            x_offset : x_offset + car_resized.shape[1],
-            c,
-        ] = (
-            background[
-                y_offset : y_offset + car_resized.shape[0],
-                x_offset : x_offset + car_resized.shape[1],
-                c,
-            ]
-            * (1 - mask)
-            + car_resized[:, :, c] * mask
-        )
+    blend_into(
+        background,
+        cv2.cvtColor(car_resized, cv2.COLOR_BGRA2BGR),
+        car_resized[:, :, 3],
+        x_offset,
+        y_offset,
+    )
 
     cv2.imwrite(output_path, background)
 
 
-# rm_session = new_session("sam")
-rm_session = new_session()
+def read_rgb_image(image_path: str) -> np.ndarray:
+    """
+    Decodes an image file as an RGB array, applying EXIF orientation.
+
+    :param image_path: path to the image.
+    :return: uint8 array of shape (H, W, 3).
+    """
+    with Image.open(image_path) as image:
+        return np.asarray(ImageOps.exif_transpose(image).convert("RGB"))
+
+
+def remove_background_with(
+    backend: str,
+    image_path: str,
+    output_path: str,
+    quality: Optional[QualityTier] = None,
+    rembg_model: Optional[str] = None,
+    crop: bool = False,
+    preserve_shadows: bool = False,
+) -> None:
+    """
+    Removes the background with a segmentation backend and saves RGBA PNG.
+
+    The PNG is encoded once, cropping only slices the arrays.
+
+    :param backend: name of the backend in ``segmentation_backends``.
+    :param image_path: path to the input image.
+    :param output_path: path of the output PNG.
+    :param quality: requested quality tier.
+    :param rembg_model: requested rembg model, used by the rembg backend.
+    :param crop: crop the cutout to the box of the object.
+    :param preserve_shadows: keep the original color under soft alpha.
+    """
+    image = read_rgb_image(image_path)
+    alpha = segment_image(get_backend(backend), image, quality, rembg_model)
+    if crop:
+        image, alpha = crop_to_alpha(image, alpha)
+    make_cutout = soft_cutout if preserve_shadows else cutout
+    Image.fromarray(make_cutout(image, alpha)).save(output_path, "PNG")
 
 
-def remove_background(image_path: str, output_path: str) -> None:
+def remove_background(
+    image_path: str,
+    output_path: str,
+    rembg_model: Optional[str] = None,
+    crop: bool = False,
+) -> None:
     """
     Removes the background from an image and saves the result to the output path.
 
     Args:
         image_path (str): The path to the input image file.
         output_path (str): The path to save the output image file.
+        rembg_model (str, optional): rembg model, the default one if not set.
+        crop (bool, optional): crop the result to the box of the object.
 
     Returns:
         None
@@ -118,20 +135,13 @@ def remove_background(image_path: str, output_path: str) -> None:
     Examples:
         remove_background("input.jpg", "output.jpg")
     """
-    with open(image_path, "rb") as i:
-        with open(output_path, "wb") as o:
-            input_data = i.read()
-            output_data = remove(data=input_data, session=rm_session)
-            output_data = remove(data=output_data, session=rm_session)
-            o.write(output_data)
-
-
-def crop_to_object(image_path, output_path):
-    image = Image.open(image_path).convert("RGBA")
-    alpha = image.split()[3]
-    bbox = alpha.getbbox()
-    cropped_image = image.crop(bbox)
-    cropped_image.save(output_path, "PNG")
+    remove_background_with(
+        settings.segmentation_backend,
+        image_path,
+        output_path,
+        rembg_model=rembg_model,
+        crop=crop,
+    )
 
 
 def get_content_type(image_path):
@@ -158,9 +168,9 @@ def change_background_image(
     output_image_path,
     position: ChangeBgPositionModelInputDto,
     container_name=None,
+    rembg_model: Optional[str] = None,
 ):
-    remove_background(image_path, rm_image_path)
-    crop_to_object(rm_image_path, rm_image_path)
+    remove_background(image_path, rm_image_path, rembg_model, crop=True)
     add_car_to_background(
         rm_image_path,
         background_image_path,
@@ -186,49 +196,104 @@ def change_background_image(
     )
 
 
-def remove_background_image(image_path, rm_image_path, crop: bool = True):
-    remove_background(image_path, rm_image_path)
-    if crop:
-        crop_to_object(rm_image_path, rm_image_path)
-
-
-def remove_background_2(image_path, rm_image_path):
-    # net = BriaRMBG()
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    net = BriaRMBG.from_pretrained("briaai/RMBG-1.4")
-    net.to(device)
-    net.eval()
+def change_background_in_memory(
+    file_name: str,
+    image: ImageSource,
+    background: ImageInput,
+    position: ChangeBgPositionModelInputDto,
+    container_name: Optional[str] = None,
+    output_image_path: Optional[str] = None,
+    backend: Optional[str] = None,
+    quality: Optional[QualityTier] = None,
+    rembg_model: Optional[str] = None,
+    preserve_shadows: bool = False,
+) -> bytes:
+    """
+    Changes the background without temporary files.
+
+    Inputs are decoded once and the result is encoded once,
+    then uploaded to blob storage and/or saved as the output file.
+
+    :param file_name: base name of the result.
+    :param image: encoded image with the car.
+    :param background: encoded or decoded background.
+    :param position: position of the car on the background.
+    :param container_name: blob container to upload the result to.
+    :param output_image_path: path to save the result to.
+    :param backend: segmentation backend, ``segmentation_backend`` if not set.
+    :param quality: requested quality tier.
+    :param rembg_model: requested rembg model.
+    :param preserve_shadows: segment with ``segmentation_backend_3``
+        and keep soft shadows on the background.
+    :return: JPEG encoded result.
+    """
+    if preserve_shadows:
+        backend = settings.segmentation_backend_3
+    result = change_background_bytes(
+        image,
+        background,
+        backend or settings.segmentation_backend,
+        position.height_position,
+        position.width_position,
+        position.scale_factor,
+        quality,
+        rembg_model,
+        preserve_shadows,
+    )
+    store_result(result, file_name, container_name, output_image_path)
+    return result
 
-    # prepare input
-    model_input_size = [1024, 1024]
-    orig_im = io.imread(image_path)
-    orig_im_size = orig_im.shape[:2]
-    image = preprocess_image(orig_im, model_input_size).to(device)
 
-    # inference
-    result = net(image)
+def remove_background_image(
+    image_path,
+    rm_image_path,
+    crop: bool = True,
+    rembg_model: Optional[str] = None,
+):
+    remove_background(image_path, rm_image_path, rembg_model, crop)
 
-    # post process
-    result_image = postprocess_image(result[0][0], orig_im_size)
 
-    # save result
-    pil_im = Image.fromarray(result_image)
-    no_bg_image = Image.new("RGBA", pil_im.size, (0, 0, 0, 0))
-    orig_image = Image.open(image_path)
-    no_bg_image.paste(orig_image, mask=pil_im)
-    no_bg_image.save(rm_image_path)
+def remove_background_2(
+    image_path,
+    rm_image_path,
+    quality: Optional[QualityTier] = None,
+    rembg_model: Optional[str] = None,
+    crop: bool = False,
+):
+    remove_background_with(
+        settings.segmentation_backend_2,
+        image_path,
+        rm_image_path,
+        quality,
+        rembg_model,
+        crop,
+    )
 
 
-def remove_background_image_2(image_path, rm_image_path, crop: bool = True):
-    remove_background_2(image_path, rm_image_path)
-    if crop:
-        crop_to_object(rm_image_path, rm_image_path)
+def remove_background_image_2(
+    image_path,
+    rm_image_path,
+    crop: bool = True,
+    quality: Optional[QualityTier] = None,
+    rembg_model: Optional[str] = None,
+):
+    remove_background_2(image_path, rm_image_path, quality, rembg_model, crop)
 
 
-def remove_background_image_3(image_path, rm_image_path, crop: bool = True):
-    remove_background_preserve_shadows(image_path, rm_image_path)
-    if crop:
-        crop_to_object(rm_image_path, rm_image_path)
+def remove_background_image_3(
+    image_path,
+    rm_image_path,
+    crop: bool = True,
+    quality: Optional[QualityTier] = None,
+    rembg_model: Optional[str] = None,
+):
+    remove_background_preserve_shadows(
+        image_path,
+        rm_image_path,
+        quality,
+        rembg_model,
+        crop,
+    )
 
 
 def generate_unique_name():
@@ -249,9 +314,15 @@ def change_background_image_2(
     output_image_path,
     position: ChangeBgPositionModelInputDto,
     container_name=None,
+    quality: Optional[QualityTier] = None,
+    rembg_model: Optional[str] = None,
 ):
-    remove_background_image_2(image_path, rm_image_path)
-    crop_to_object(rm_image_path, rm_image_path)
+    remove_background_image_2(
+        image_path,
+        rm_image_path,
+        quality=quality,
+        rembg_model=rembg_model,
+    )
     add_car_to_background(
         rm_image_path,
         background_image_path,
@@ -277,59 +348,19 @@ def change_background_image_2(
     )
 
 
-def preprocess_image3(image, size):
-    # Resize and normalize the image for the model
-    image = Image.fromarray(image)
-    image = image.resize(
-        size,
-        Image.Resampling.LANCZOS if hasattr(Image, "Resampling") else Image.ANTIALIAS,
-    )
-    image = np.array(image).astype(np.float32) / 255.0
-    image = torch.tensor(image).permute(2, 0, 1).unsqueeze(0)
-    return image
-
-
-def postprocess_image3(tensor, original_size):
-    # Convert the tensor back to an image and resize to original size
-    image = tensor.detach().cpu().numpy()
-    image = np.clip(image * 255, 0, 255).astype(np.uint8)
-    if image.shape[0] == 1:  # If the image is a single channel, squeeze it
-        image = image.squeeze(axis=0)
-    else:
-        image = image.transpose(1, 2, 0)  # Convert from (C, H, W) to (H, W, C)
-    image = Image.fromarray(image)
-    image = image.resize(
-        original_size,
-        Image.Resampling.LANCZOS if hasattr(Image, "Resampling") else Image.ANTIALIAS,
+def remove_background_preserve_shadows(
+    image_path,
+    rm_image_path,
+    quality: Optional[QualityTier] = None,
+    rembg_model: Optional[str] = None,
+    crop: bool = False,
+):
+    remove_background_with(
+        settings.segmentation_backend_3,
+        image_path,
+        rm_image_path,
+        quality,
+        rembg_model,
+        crop,
+        preserve_shadows=True,
     )
-    return np.array(image)
-
-
-def remove_background_preserve_shadows(image_path, rm_image_path):
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    net = BriaRMBG.from_pretrained("briaai/RMBG-1.4")
-    net.to(device)
-    net.eval()
-
-    # prepare input
-    model_input_size = [1024, 1024]
-    orig_im = io.imread(image_path)
-    orig_im_size = orig_im.shape[:2]
-    image = preprocess_image3(orig_im, model_input_size).to(device)
-
-    # inference
-    result = net(image)
-
-    # post process
-    result_image = postprocess_image3(result[0][0], orig_im_size)
-
-    # save result
-    pil_im = Image.fromarray(result_image)
-    no_bg_image = Image.new("RGBA", pil_im.size, (0, 0, 0, 0))
-    orig_image = Image.open(image_path).convert("RGBA")
-
-    # Create an alpha mask to preserve shadows
-    alpha_mask = pil_im.convert("L")
-    blended_image = Image.composite(orig_image, no_bg_image, alpha_mask)
-
-    blended_image.save(rm_image_path)
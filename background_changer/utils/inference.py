@@ -0,0 +1,82 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+import torch
+from loguru import logger
+
+from background_changer.settings import settings
+
+
+@contextmanager
+def inference_context() -> Iterator[None]:
+    """
+    Execution context for every torch model forward pass.
+
+    Disables autograd bookkeeping with ``torch.inference_mode``,
+    so activations are freed as soon as they are consumed,
+    and enables bf16 autocast on CPU if ``inference_bf16`` is set.
+
+    :yields: nothing.
+    """
+    with torch.inference_mode():
+        with torch.autocast(
+            "cpu",
+            dtype=torch.bfloat16,
+            enabled=settings.inference_bf16,
+        ):
+            yield
+
+
+def prepare_model(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Switches a loaded model to the configured memory format.
+
+    :param model: model in eval mode.
+    :return: same model.
+    """
+    if settings.inference_channels_last:
+        model.to(memory_format=torch.channels_last)  # type: ignore
+    return model
+
+
+def prepare_input(tensor: torch.Tensor) -> torch.Tensor:
+    """
+    Converts a 4D input to the configured memory format.
+
+    :param tensor: input of shape (N, C, H, W).
+    :return: input in the memory format of the models.
+    """
+    if settings.inference_channels_last:
+        return tensor.contiguous(memory_format=torch.channels_last)
+    return tensor
+
+
+def worker_cpu_count() -> int:
+    """
+    Number of cores available to a single uvicorn worker.
+
+    :return: cores divided between ``workers_count`` workers.
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, settings.workers_count))
+
+
+def configure_torch_threads() -> None:
+    """
+    Sets torch thread pools of the current worker.
+
+    Every uvicorn worker runs its own intra-op pool, so by default
+    available cores are split between ``workers_count`` workers
+    to avoid oversubscription.
+    """
+    num_threads = settings.torch_num_threads or worker_cpu_count()
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(settings.torch_interop_threads)
+    except RuntimeError:
+        # Interop pool can only be set before it is used for the first time.
+        logger.warning("Torch interop threads are already initialized")
+    logger.info(
+        f"Torch uses {torch.get_num_threads()} intra-op "
+        f"and {torch.get_num_interop_threads()} inter-op threads",
+    )
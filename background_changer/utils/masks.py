@@ -0,0 +1,107 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from background_changer.settings import settings
+
+
+def cutout(image: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+    """
+    Builds RGBA cutout of the foreground.
+
+    Same as pasting the image on a transparent canvas with the mask,
+    so the color is premultiplied by alpha.
+
+    :param image: RGB uint8 image of shape (H, W, 3).
+    :param alpha: uint8 alpha of shape (H, W).
+    :return: RGBA uint8 image of shape (H, W, 4).
+    """
+    rgb = (image.astype(np.uint16) * alpha[:, :, np.newaxis] + 127) // 255
+    return np.dstack((rgb.astype(np.uint8), alpha))
+
+
+def soft_cutout(image: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+    """
+    Builds RGBA cutout that keeps the original color under soft alpha.
+
+    Unlike :func:`cutout` the color is not premultiplied, so half
+    transparent shadows keep their color and are darkened only once,
+    when they are composited. The alpha is written straight into
+    the RGBA buffer converted from the image.
+
+    :param image: RGB uint8 image of shape (H, W, 3).
+    :param alpha: uint8 alpha of shape (H, W).
+    :return: RGBA uint8 image of shape (H, W, 4).
+    """
+    rgba = cv2.cvtColor(image, cv2.COLOR_RGB2RGBA)
+    rgba[:, :, 3] = alpha
+    return rgba
+
+
+def alpha_bbox(
+    alpha: np.ndarray,
+    threshold: int = 0,
+    padding: int = 0,
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Finds the box of the foreground with row and column reductions.
+
+    Columns are only reduced over the rows that have foreground.
+
+    :param alpha: uint8 alpha of shape (H, W).
+    :param threshold: alpha values up to it are background.
+    :param padding: pixels added on every side, clipped to the image.
+    :return: (left, top, right, bottom) or None if there's no foreground.
+    """
+    foreground = alpha > threshold
+    rows = np.flatnonzero(foreground.any(axis=1))
+    if not len(rows):
+        return None
+    top, bottom = rows[0], rows[-1] + 1
+    cols = np.flatnonzero(foreground[top:bottom].any(axis=0))
+    height, width = alpha.shape
+    return (
+        max(int(cols[0]) - padding, 0),
+        max(int(top) - padding, 0),
+        min(int(cols[-1]) + 1 + padding, width),
+        min(int(bottom) + padding, height),
+    )
+
+
+def keep_largest_component(alpha: np.ndarray) -> np.ndarray:
+    """
+    Removes every blob of the mask except the largest one.
+
+    :param alpha: uint8 alpha of shape (H, W).
+    :return: alpha with only the largest connected component.
+    """
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(
+        (alpha > 0).astype(np.uint8),
+        connectivity=8,
+    )
+    if count <= 2:
+        return alpha
+    largest = 1 + np.argmax(stats[1:, cv2.CC_STAT_AREA])
+    return np.where(labels == largest, alpha, 0).astype(np.uint8)
+
+
+def clean_mask(alpha: np.ndarray) -> np.ndarray:
+    """
+    Mask cleanup applied instead of extra segmentation passes.
+
+    Steps are configured in settings: low alpha values are dropped
+    (``mask_threshold``), the mask is eroded (``mask_erode_size``)
+    and small detached blobs are removed (``mask_keep_largest_component``).
+
+    :param alpha: uint8 alpha of shape (H, W).
+    :return: cleaned alpha.
+    """
+    if settings.mask_threshold:
+        alpha = np.where(alpha < settings.mask_threshold, 0, alpha).astype(np.uint8)
+    if settings.mask_erode_size:
+        kernel = np.ones((settings.mask_erode_size, settings.mask_erode_size), np.uint8)
+        alpha = cv2.erode(alpha, kernel)
+    if settings.mask_keep_largest_component:
+        alpha = keep_largest_component(alpha)
+    return alpha
@@ -0,0 +1,161 @@
+import cv2
+import numpy as np
+
+from background_changer.settings import settings
+
+from .refinement import select_tiles
+
+UNKNOWN = 128
+
+
+def build_trimap(alpha: np.ndarray, low: int, high: int, band: int) -> np.ndarray:
+    """
+    Builds a trimap from a segmentation mask.
+
+    Foreground (alpha >= ``high``) and background (alpha <= ``low``)
+    are eroded by ``band`` pixels, everything left between them is unknown.
+
+    :param alpha: uint8 alpha of shape (H, W).
+    :param low: alpha values up to it are background.
+    :param high: alpha values from it are foreground.
+    :param band: width of the unknown band on each side of an edge.
+    :return: uint8 trimap with 0, ``UNKNOWN`` and 255.
+    """
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * band + 1,) * 2)
+    foreground = cv2.erode((alpha >= high).view(np.uint8), kernel)
+    background = cv2.erode((alpha <= low).view(np.uint8), kernel)
+    trimap = np.full(alpha.shape, UNKNOWN, dtype=np.uint8)
+    trimap[foreground.view(bool)] = 255
+    trimap[background.view(bool)] = 0
+    return trimap
+
+
+class GuidedFilter:
+    """
+    Color guided filter of He et al.
+
+    Fits the input as a local linear function of the RGB guide
+    in every window, so the result follows the edges of the image.
+    Statistics of the guide, including the inverse of the 3x3
+    covariance of every window, are computed once, so filtering
+    several inputs with the same guide is cheap.
+    """
+
+    def __init__(self, guide: np.ndarray, radius: int, eps: float) -> None:
+        """
+        Precomputes statistics of the guide.
+
+        :param guide: float32 RGB guide in [0, 1] of shape (H, W, 3).
+        :param radius: radius of the box window.
+        :param eps: regularization, higher values smooth more.
+        """
+        self.size = (2 * radius + 1, 2 * radius + 1)
+        self.guide = guide
+        self.mean_guide = self._box(guide)
+        r, g, b = (guide[:, :, channel] for channel in range(3))
+        mr, mg, mb = (self.mean_guide[:, :, channel] for channel in range(3))
+        rr = self._box(r * r) - mr * mr + eps
+        rg = self._box(r * g) - mr * mg
+        rb = self._box(r * b) - mr * mb
+        gg = self._box(g * g) - mg * mg + eps
+        gb = self._box(g * b) - mg * mb
+        bb = self._box(b * b) - mb * mb + eps
+        det = rr * (gg * bb - gb * gb) + rg * (gb * rb - rg * bb)
+        det += rb * (rg * gb - gg * rb)
+        self.inverse = [
+            (gg * bb - gb * gb) / det,
+            (gb * rb - rg * bb) / det,
+            (rg * gb - gg * rb) / det,
+            (rr * bb - rb * rb) / det,
+            (rb * rg - rr * gb) / det,
+            (rr * gg - rg * rg) / det,
+        ]
+
+    def __call__(self, source: np.ndarray) -> np.ndarray:
+        """
+        Filters an input.
+
+        :param source: float32 input of shape (H, W).
+        :return: float32 filtered input of shape (H, W).
+        """
+        mean_source = self._box(source)
+        cov = self._box(self.guide * source[:, :, np.newaxis])
+        cov -= self.mean_guide * mean_source[:, :, np.newaxis]
+        cr, cg, cb = (cov[:, :, channel] for channel in range(3))
+        inv_rr, inv_rg, inv_rb, inv_gg, inv_gb, inv_bb = self.inverse
+        a_r = inv_rr * cr + inv_rg * cg + inv_rb * cb
+        a_g = inv_rg * cr + inv_gg * cg + inv_gb * cb
+        a_b = inv_rb * cr + inv_gb * cg + inv_bb * cb
+        mr, mg, mb = (self.mean_guide[:, :, channel] for channel in range(3))
+        offset = mean_source - a_r * mr - a_g * mg - a_b * mb
+        r, g, b = (self.guide[:, :, channel] for channel in range(3))
+        return (
+            self._box(a_r) * r
+            + self._box(a_g) * g
+            + self._box(a_b) * b
+            + self._box(offset)
+        )
+
+    def _box(self, array: np.ndarray) -> np.ndarray:
+        return cv2.boxFilter(array, -1, self.size, borderType=cv2.BORDER_REFLECT)
+
+
+def matte(image: np.ndarray, alpha: np.ndarray, tile_size: int = 0) -> np.ndarray:
+    """
+    Refines alpha inside the unknown band of the trimap.
+
+    Known foreground and background are set to 255 and 0. The image
+    is split into square tiles and only tiles with unknown pixels
+    are filtered, with enough context around them for every pass,
+    so the cost grows with the length of the edges and not the area.
+    The filter is applied ``matting_iterations`` times, known pixels
+    are reset after every pass, so the edge moves towards the color
+    edge of the image instead of just being smoothed.
+
+    :param image: RGB uint8 image of shape (H, W, 3).
+    :param alpha: uint8 alpha of shape (H, W).
+    :param tile_size: side of a tile, ``matting_tile_size`` if not set.
+    :return: matted uint8 alpha of shape (H, W).
+    """
+    tile_size = tile_size or settings.matting_tile_size
+    radius = settings.matting_radius
+    # Every pass spreads information by the radius of the window.
+    context = radius * (settings.matting_iterations + 1)
+    trimap = build_trimap(
+        alpha,
+        settings.refine_low,
+        settings.refine_high,
+        settings.matting_band,
+    )
+    unknown = trimap == UNKNOWN
+    source = np.where(unknown, alpha, trimap)
+    matted = source.copy()
+    height, width = alpha.shape
+    for row, col in select_tiles(unknown, tile_size, 0):
+        top, left = row * tile_size, col * tile_size
+        bottom, right = min(top + tile_size, height), min(left + tile_size, width)
+        crop_top, crop_left = max(top - context, 0), max(left - context, 0)
+        crop_bottom = min(bottom + context, height)
+        crop_right = min(right + context, width)
+        crop = (slice(crop_top, crop_bottom), slice(crop_left, crop_right))
+        guided_filter = GuidedFilter(
+            image[crop].astype(np.float32) / 255,
+            radius,
+            settings.matting_eps,
+        )
+        known = ~unknown[crop]
+        filtered = source[crop].astype(np.float32) / 255
+        for _ in range(settings.matting_iterations):
+            filtered = np.clip(guided_filter(filtered), 0, 1)
+            filtered[known] = source[crop][known] / 255
+        inner = filtered[
+            top - crop_top : bottom - crop_top,
+            left - crop_left : right - crop_left,
+        ]
+        tile_unknown = unknown[top:bottom, left:right]
+        matted[top:bottom, left:right][tile_unknown] = np.clip(
+            inner[tile_unknown] * 255 + 0.5,
+            0,
+            255,
+        ).astype(np.uint8)
+    return matted
@@ -0,0 +1,239 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+import torch
+from loguru import logger
+
+from background_changer.settings import settings
+
+from .briarmbg import BriaRMBG
+from .inference import prepare_model
+from .session_pool import SessionPoolCache, rembg_session_pool
+
+BRIA_RMBG = "bria_rmbg"
+REMBG = "rembg"
+TRANSFORMERS_RMBG = "transformers_rmbg"
+CAR_DETECTOR = "car_detector"
+
+
+@dataclass
+class ModelState:
+    """Load state of a single registered model."""
+
+    name: str
+    status: str = "not_loaded"
+    device: Optional[str] = None
+    load_seconds: Optional[float] = None
+    loaded_at: Optional[float] = None
+    error: Optional[str] = None
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of inference models.
+
+    Every model is loaded lazily at most once per worker process
+    and then shared between all threads of that worker.
+    Models are only ever used in eval mode, so sharing them
+    between the threadpool workers of sync endpoints is safe.
+    """
+
+    def __init__(self) -> None:
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._states: Dict[str, ModelState] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._preload: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        preload: bool = True,
+    ) -> None:
+        """
+        Registers a loader for a model.
+
+        :param name: name of the model.
+        :param loader: callable that builds a ready to use model.
+        :param preload: whether :meth:`load_all` loads the model.
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._preload[name] = preload
+            self._locks.setdefault(name, threading.Lock())
+            self._states.setdefault(name, ModelState(name=name))
+
+    def get(self, name: str) -> Any:
+        """
+        Returns a loaded model, loading it on first use.
+
+        :param name: name of the model.
+        :returns: loaded model.
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._get_lock(name):
+            model = self._models.get(name)
+            if model is None:
+                model = self._load(name)
+        return model
+
+    def reload(self, name: str) -> Any:
+        """
+        Loads a model again and replaces the shared instance.
+
+        Requests that already hold the old instance finish with it.
+
+        :param name: name of the model.
+        :returns: freshly loaded model.
+        """
+        with self._get_lock(name):
+            return self._load(name)
+
+    def load_all(self) -> None:
+        """Loads every registered model for preloading that is not loaded yet."""
+        for name in list(self._loaders):
+            if self._preload[name]:
+                self.get(name)
+
+    def is_loaded(self, name: str) -> bool:
+        """
+        Checks whether the model is already loaded.
+
+        :param name: name of the model.
+        :returns: True if model is loaded.
+        """
+        return name in self._models
+
+    def status(self) -> list[ModelState]:
+        """
+        Returns load state of every registered model.
+
+        :returns: list of model states.
+        """
+        return list(self._states.values())
+
+    def _get_lock(self, name: str) -> threading.Lock:
+        if name not in self._loaders:
+            raise KeyError(f"Model {name!r} is not registered")
+        return self._locks[name]
+
+    def _load(self, name: str) -> Any:
+        state = self._states[name]
+        state.status = "loading"
+        state.error = None
+        start = time.perf_counter()
+        try:
+            model = self._loaders[name]()
+        except Exception as exc:
+            state.status = "failed"
+            state.error = str(exc)
+            logger.exception(f"Failed to load model {name}")
+            raise
+        state.status = "loaded"
+        state.load_seconds = time.perf_counter() - start
+        state.loaded_at = time.time()
+        if isinstance(model, torch.nn.Module):
+            state.device = str(next(model.parameters()).device)
+        self._models[name] = model
+        logger.info(f"Loaded model {name} in {state.load_seconds:.2f}s")
+        return model
+
+
+def get_device() -> torch.device:
+    """
+    Returns the device inference should run on.
+
+    :returns: torch device.
+    """
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def load_bria_rmbg() -> Any:
+    """
+    Loads BriaRMBG weights and prepares the model for inference.
+
+    The backend is selected with ``bria_backend`` setting.
+
+    :returns: model with ``forward_mask`` method.
+    """
+    if settings.bria_backend == "onnx":
+        from .onnx_backend import load_bria_onnx  # noqa: WPS433
+
+        return load_bria_onnx()
+    if settings.bria_backend == "onnx_int8":
+        from .quantization import load_bria_onnx_int8  # noqa: WPS433
+
+        return load_bria_onnx_int8()
+    net = BriaRMBG.from_pretrained(settings.bria_model_name)
+    net.to(get_device())
+    net.eval()
+    if settings.fuse_batchnorm:
+        net.fuse()
+    return prepare_model(net)
+
+
+def load_rembg_sessions() -> Any:
+    """
+    Creates cache of rembg session pools.
+
+    Only the pool of the default ``rembg_model`` is loaded,
+    other models are loaded on first request.
+
+    :returns: session pool cache.
+    """
+    sessions = SessionPoolCache(
+        rembg_session_pool,
+        settings.rembg_max_models,
+        settings.rembg_model_idle_seconds,
+    )
+    # Fail on load and not on the first request if the model is broken.
+    sessions.get(settings.rembg_model).prefill(1)
+    return sessions
+
+
+def load_transformers_rmbg() -> Any:
+    """
+    Loads RMBG through transformers.
+
+    :returns: feature extractor and model.
+    """
+    from transformers import (  # noqa: WPS433
+        AutoFeatureExtractor,
+        AutoModelForImageSegmentation,
+    )
+
+    feature_extractor = AutoFeatureExtractor.from_pretrained(settings.bria_model_name)
+    model = AutoModelForImageSegmentation.from_pretrained(settings.bria_model_name)
+    return feature_extractor, model.eval()
+
+
+def load_car_detector() -> Any:
+    """
+    Loads Faster R-CNN detector pretrained on COCO.
+
+    :returns: detector in eval mode.
+    """
+    from torchvision.models.detection import (  # noqa: WPS433
+        FasterRCNN_ResNet50_FPN_Weights,
+        fasterrcnn_resnet50_fpn,
+    )
+
+    model = fasterrcnn_resnet50_fpn(weights=FasterRCNN_ResNet50_FPN_Weights.DEFAULT)
+    return model.to(get_device()).eval()
+
+
+model_registry = ModelRegistry()
+model_registry.register(BRIA_RMBG, load_bria_rmbg)
+model_registry.register(REMBG, load_rembg_sessions)
+model_registry.register(TRANSFORMERS_RMBG, load_transformers_rmbg)
+model_registry.register(
+    CAR_DETECTOR,
+    load_car_detector,
+    preload=settings.detector_roi,
+)
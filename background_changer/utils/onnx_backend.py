@@ -0,0 +1,161 @@
+"""
+ONNX export and onnxruntime backend for BriaRMBG.
+
+Export the model once with::
+
+    python -m background_changer.utils.onnx_backend --output model.onnx
+
+Without ``--output`` the model is written to the cache directory
+the server reads it from (``model_cache_dir``).
+"""
+
+import argparse
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import torch
+from loguru import logger
+
+from background_changer.settings import settings
+
+from .briarmbg import BriaRMBG
+
+
+class _MaskOnly(torch.nn.Module):
+    """Exports only the primary mask of BriaRMBG."""
+
+    def __init__(self, net: BriaRMBG) -> None:
+        super().__init__()
+        self.net = net
+
+    def forward(self, image: torch.Tensor) -> torch.Tensor:
+        return self.net.forward_mask(image)
+
+
+class OnnxBriaRMBG:
+    """
+    BriaRMBG running in onnxruntime.
+
+    Has the same ``forward_mask`` interface as :class:`BriaRMBG`,
+    so it can be used by the inference code without changes.
+    """
+
+    def __init__(self, model_path: Path) -> None:
+        import onnxruntime as ort  # noqa: WPS433
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = settings.onnx_intra_op_threads
+        options.inter_op_num_threads = settings.onnx_inter_op_threads
+        providers = [
+            provider
+            for provider in ("CUDAExecutionProvider", "CPUExecutionProvider")
+            if provider in ort.get_available_providers()
+        ]
+        self.model_path = model_path
+        self.session = ort.InferenceSession(
+            str(model_path),
+            sess_options=options,
+            providers=providers,
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def forward_mask(self, image: torch.Tensor) -> torch.Tensor:
+        """
+        Computes the primary mask.
+
+        :param image: normalized input of shape (N, 3, H, W).
+        :return: mask of shape (N, 1, H, W).
+        """
+        inputs = np.ascontiguousarray(image.detach().cpu().numpy(), dtype=np.float32)
+        (mask,) = self.session.run(None, {self.input_name: inputs})
+        return torch.from_numpy(mask)
+
+    __call__ = forward_mask
+
+
+def default_onnx_path(model_name: Optional[str] = None) -> Path:
+    """
+    Path of the cached ONNX export of a model.
+
+    :param model_name: name of the model on huggingface hub.
+    :return: path to the onnx file.
+    """
+    model_name = model_name or settings.bria_model_name
+    return settings.model_cache_dir / f"{model_name.replace('/', '--')}.onnx"
+
+
+def export_bria_rmbg(
+    output_path: Path,
+    net: Optional[BriaRMBG] = None,
+    input_size: int = 1024,
+    opset: int = 17,
+) -> Path:
+    """
+    Exports mask-only BriaRMBG to ONNX.
+
+    Batch and spatial dimensions are dynamic.
+
+    :param output_path: where to save the model.
+    :param net: model to export, loaded from the hub if not set.
+    :param input_size: spatial size of the example input.
+    :param opset: ONNX opset version.
+    :return: path to the exported model.
+    """
+    if net is None:
+        net = BriaRMBG.from_pretrained(settings.bria_model_name)
+    net = net.cpu().eval()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Every export writes to its own temporary file, so workers exporting
+    # at the same time never interleave writes or see a partial export.
+    fd, tmp_name = tempfile.mkstemp(dir=output_path.parent, suffix=".onnx")
+    os.close(fd)
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                _MaskOnly(net).eval(),
+                torch.randn(1, 3, input_size, input_size),
+                tmp_name,
+                input_names=["image"],
+                output_names=["mask"],
+                dynamic_axes={
+                    "image": {0: "batch", 2: "height", 3: "width"},
+                    "mask": {0: "batch", 2: "height", 3: "width"},
+                },
+                opset_version=opset,
+            )
+        os.replace(tmp_name, output_path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    logger.info(f"Exported {settings.bria_model_name} to {output_path}")
+    return output_path
+
+
+def load_bria_onnx() -> OnnxBriaRMBG:
+    """
+    Loads onnxruntime BriaRMBG, exporting it on first use.
+
+    :return: onnxruntime model.
+    """
+    model_path = default_onnx_path()
+    if not model_path.exists():
+        export_bria_rmbg(model_path)
+    return OnnxBriaRMBG(model_path)
+
+
+def main() -> None:
+    """Exports BriaRMBG to ONNX."""
+    parser = argparse.ArgumentParser(description="Export BriaRMBG to ONNX.")
+    parser.add_argument("--output", type=Path, default=default_onnx_path())
+    parser.add_argument("--input-size", type=int, default=1024)
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+    export_bria_rmbg(args.output, input_size=args.input_size, opset=args.opset)
+
+
+if __name__ == "__main__":
+    main()
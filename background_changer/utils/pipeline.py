@@ -0,0 +1,275 @@
+"""
+In-memory change background pipeline.
+
+Every input is decoded once, intermediates stay numpy arrays and
+the result is encoded once, so the bytes can go straight to blob
+storage or to the response. Encoded inputs larger than
+``in_memory_image_max_bytes`` are spooled to disk.
+"""
+
+import io
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+from background_changer.settings import settings
+
+from .azure_storage import upload_bytes_to_blob_storage
+from .compositing import blend_into
+from .masks import alpha_bbox, cutout, soft_cutout
+from .resolution import QualityTier
+from .segmentation import get_backend, segment_image
+
+ImageSource = Union[bytes, BinaryIO]
+# Encoded image or an already decoded RGB array.
+ImageInput = Union[ImageSource, np.ndarray]
+
+
+def spooled_file() -> SpooledTemporaryFile:
+    """
+    Creates a buffer for encoded images that spills to disk when it grows.
+
+    :return: file kept in memory up to ``in_memory_image_max_bytes``.
+    """
+    return SpooledTemporaryFile(max_size=settings.in_memory_image_max_bytes)
+
+
+def close_image(source: ImageSource) -> None:
+    """
+    Closes an encoded image file, bytes are left as they are.
+
+    :param source: encoded image or a file with it.
+    """
+    if not isinstance(source, bytes):
+        source.close()
+
+
+def decode_image(source: ImageSource) -> np.ndarray:
+    """
+    Decodes an encoded image as an RGB array, applying EXIF orientation.
+
+    :param source: encoded image or a file with it.
+    :return: uint8 array of shape (H, W, 3).
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    source.seek(0)
+    with Image.open(source) as image:
+        return np.asarray(ImageOps.exif_transpose(image).convert("RGB"))
+
+
+def encode_image(image: np.ndarray, img_format: str = "JPEG") -> bytes:
+    """
+    Encodes an RGB or RGBA array.
+
+    :param image: uint8 array of shape (H, W, 3) or (H, W, 4).
+    :param img_format: "JPEG" or "PNG".
+    :return: encoded image.
+    """
+    code = cv2.COLOR_RGBA2BGRA if image.shape[2] == 4 else cv2.COLOR_RGB2BGR
+    extension = ".png" if img_format == "PNG" else ".jpg"
+    _, encoded = cv2.imencode(extension, cv2.cvtColor(image, code))
+    return encoded.tobytes()
+
+
+def crop_to_alpha(
+    image: np.ndarray,
+    alpha: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Crops an image and its alpha to the box of the foreground.
+
+    The box is found with ``crop_alpha_threshold`` and ``crop_padding``.
+
+    :param image: image of shape (H, W, C).
+    :param alpha: uint8 alpha of shape (H, W).
+    :return: views of the image and the alpha, unchanged if alpha is empty.
+    """
+    box = alpha_bbox(alpha, settings.crop_alpha_threshold, settings.crop_padding)
+    if box is None:
+        return image, alpha
+    left, top, right, bottom = box
+    return image[top:bottom, left:right], alpha[top:bottom, left:right]
+
+
+def place_car(
+    background: np.ndarray,
+    car: np.ndarray,
+    height_position: float = 0.69,
+    width_position: float = 0.5,
+    scale_factor: float = 0.62,
+) -> np.ndarray:
+    """
+    Scales an RGBA car cutout to the background and blends it in place.
+
+    Same placement as :func:`image_utils.add_car_to_background`.
+
+    :param background: RGB background, modified in place.
+    :param car: RGBA cutout of the car.
+    :param height_position: vertical position of the car in [0, 1].
+    :param width_position: horizontal position of the car in [0, 1].
+    :param scale_factor: car width relative to the background width.
+    :return: the background.
+    """
+    background_height, background_width = background.shape[:2]
+    car_width = int(background_width * scale_factor)
+    car_height = int((car_width / car.shape[1]) * car.shape[0])
+    car = cv2.resize(car, (car_width, car_height))
+    return blend_into(
+        background,
+        cv2.cvtColor(car, cv2.COLOR_RGBA2RGB),
+        car[:, :, 3],
+        int(width_position * (background_width - car_width)),
+        int(height_position * (background_height - car_height)),
+    )
+
+
+def change_background_array(
+    image: np.ndarray,
+    background: np.ndarray,
+    backend: str,
+    height_position: float = 0.69,
+    width_position: float = 0.5,
+    scale_factor: float = 0.62,
+    quality: Optional[QualityTier] = None,
+    rembg_model: Optional[str] = None,
+    out: Optional[np.ndarray] = None,
+    preserve_shadows: bool = False,
+) -> np.ndarray:
+    """
+    Cuts the car out of an image and places it on a background.
+
+    :param image: RGB image with the car.
+    :param background: RGB background, it's not modified.
+    :param backend: name of the segmentation backend.
+    :param height_position: vertical position of the car in [0, 1].
+    :param width_position: horizontal position of the car in [0, 1].
+    :param scale_factor: car width relative to the background width.
+    :param quality: requested quality tier.
+    :param rembg_model: requested rembg model.
+    :param out: buffer of the shape of the background to composite into,
+        a new copy of the background if not set.
+    :param preserve_shadows: blend the original color with the soft alpha,
+        so shadows of the mask carry over to the background.
+    :return: RGB result of the size of the background.
+    """
+    alpha = segment_image(get_backend(backend), image, quality, rembg_model)
+    return composite_car(
+        image,
+        alpha,
+        background,
+        height_position,
+        width_position,
+        scale_factor,
+        out,
+        preserve_shadows,
+    )
+
+
+def composite_car(
+    image: np.ndarray,
+    alpha: np.ndarray,
+    background: np.ndarray,
+    height_position: float = 0.69,
+    width_position: float = 0.5,
+    scale_factor: float = 0.62,
+    out: Optional[np.ndarray] = None,
+    preserve_shadows: bool = False,
+) -> np.ndarray:
+    """
+    Places a segmented car on a background.
+
+    :param image: RGB image with the car.
+    :param alpha: uint8 alpha of the image.
+    :param background: RGB background, it's not modified.
+    :param height_position: vertical position of the car in [0, 1].
+    :param width_position: horizontal position of the car in [0, 1].
+    :param scale_factor: car width relative to the background width.
+    :param out: buffer of the shape of the background to composite into,
+        a new copy of the background if not set.
+    :param preserve_shadows: blend the original color with the soft alpha.
+    :return: RGB result of the size of the background.
+    """
+    image, alpha = crop_to_alpha(image, alpha)
+    if out is None:
+        out = background.copy()
+    else:
+        np.copyto(out, background)
+    make_cutout = soft_cutout if preserve_shadows else cutout
+    return place_car(
+        out,
+        make_cutout(image, alpha),
+        height_position,
+        width_position,
+        scale_factor,
+    )
+
+
+def change_background_bytes(
+    image: ImageSource,
+    background: ImageInput,
+    backend: str,
+    height_position: float = 0.69,
+    width_position: float = 0.5,
+    scale_factor: float = 0.62,
+    quality: Optional[QualityTier] = None,
+    rembg_model: Optional[str] = None,
+    preserve_shadows: bool = False,
+) -> bytes:
+    """
+    Changes the background of encoded images.
+
+    :param image: encoded image with the car.
+    :param background: encoded or decoded background, it's not modified.
+    :param backend: name of the segmentation backend.
+    :param height_position: vertical position of the car in [0, 1].
+    :param width_position: horizontal position of the car in [0, 1].
+    :param scale_factor: car width relative to the background width.
+    :param quality: requested quality tier.
+    :param rembg_model: requested rembg model.
+    :param preserve_shadows: keep soft shadows of the mask on the background.
+    :return: JPEG encoded result.
+    """
+    if not isinstance(background, np.ndarray):
+        background = decode_image(background)
+    result = change_background_array(
+        decode_image(image),
+        background,
+        backend,
+        height_position,
+        width_position,
+        scale_factor,
+        quality,
+        rembg_model,
+        preserve_shadows=preserve_shadows,
+    )
+    return encode_image(result)
+
+
+def store_result(
+    result: bytes,
+    file_name: str,
+    container_name: Optional[str] = None,
+    output_image_path: Optional[str] = None,
+) -> None:
+    """
+    Uploads and/or saves an encoded change background result.
+
+    :param result: JPEG encoded result.
+    :param file_name: base name of the result.
+    :param container_name: blob container to upload the result to.
+    :param output_image_path: path to save the result to.
+    """
+    if container_name:
+        upload_bytes_to_blob_storage(
+            result,
+            f"{file_name}_chbg.jpg",
+            container_name,
+            "image/jpeg",
+        )
+    if output_image_path:
+        with open(output_image_path, "wb") as output:
+            output.write(result)
@@ -0,0 +1,158 @@
+import queue
+from contextlib import contextmanager
+from typing import Iterator, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+from background_changer.settings import settings
+
+_free_buffers: "queue.Queue[torch.Tensor]" = queue.Queue(
+    maxsize=settings.preprocess_buffers or settings.inference_max_batch_size,
+)
+
+
+@contextmanager
+def input_buffer(
+    height: int,
+    width: int,
+    batch_size: int = 1,
+) -> Iterator[torch.Tensor]:
+    """
+    Checks out a float model input buffer from the shared pool.
+
+    At most ``preprocess_buffers`` free buffers are kept, callers
+    beyond that get a new buffer, which is freed when it's returned.
+    A pooled buffer of another shape is replaced.
+
+    :param height: input height.
+    :param width: input width.
+    :param batch_size: number of images in the buffer.
+    :yields: tensor of shape (batch_size, 3, height, width), used
+        exclusively until the block is left.
+    """
+    shape = (batch_size, 3, height, width)
+    try:
+        buffer = _free_buffers.get_nowait()
+    except queue.Empty:
+        buffer = None
+    if buffer is None or buffer.shape != shape:
+        buffer = torch.empty(shape, dtype=torch.float32)
+    try:
+        yield buffer
+    finally:
+        try:
+            _free_buffers.put_nowait(buffer)
+        except queue.Full:
+            pass
+
+
+def preprocess_image(
+    im: np.ndarray,
+    model_input_size: Sequence[int],
+    mean: float = 0.5,
+    std: float = 1.0,
+    out: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
+    """
+    Converts an image to a normalized model input.
+
+    The image is resized while it is still uint8, wrapped into a tensor
+    without copying and scaled and normalized straight into a float
+    tensor, so no full resolution float copy of the image is ever made.
+
+    :param im: RGB or grayscale uint8 image.
+    :param model_input_size: [height, width] of the model input.
+    :param mean: normalization mean in [0, 1] range.
+    :param std: normalization std in [0, 1] range.
+    :param out: tensor of shape (1, 3, height, width) to write into,
+        usually from :func:`input_buffer`. A new tensor if not set.
+    :return: tensor of shape (1, 3, height, width).
+    """
+    if im.ndim < 3:
+        im = cv2.cvtColor(im, cv2.COLOR_GRAY2RGB)
+    height, width = model_input_size
+    if im.shape[:2] != (height, width):
+        im = cv2.resize(im, (width, height), interpolation=cv2.INTER_AREA)
+    image = torch.from_numpy(np.ascontiguousarray(im)).permute(2, 0, 1).unsqueeze(0)
+    if out is None:
+        out = torch.empty((1, 3, height, width), dtype=torch.float32)
+    # (x / 255 - mean) / std in a single pass, the cast happens while writing.
+    torch.mul(image, 1 / (255 * std), out=out)
+    return out.sub_(mean / std)
+
+
+def _upscale(mask: np.ndarray, height: int, width: int) -> np.ndarray:
+    if mask.shape == (height, width):
+        return mask
+    return cv2.resize(mask, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def mask_range(result: torch.Tensor) -> Tuple[float, float]:
+    """
+    Range of model output used to normalize it.
+
+    :param result: model output.
+    :return: minimum and maximum of the output.
+    """
+    return float(result.min()), float(result.max())
+
+
+def postprocess_image(
+    result: torch.Tensor,
+    im_size: Sequence[int],
+    value_range: Optional[Tuple[float, float]] = None,
+) -> np.ndarray:
+    """
+    Converts model output to uint8 alpha of the original image.
+
+    The mask is min-max normalized and converted to uint8 at model
+    resolution and only then upscaled once with cv2, so no full resolution
+    float mask is allocated. Bilinear upscaling doesn't create new
+    extrema, so normalizing before or after it gives the same mask.
+
+    :param result: model output of shape (1, 1, h, w).
+    :param im_size: (height, width) of the original image.
+    :param value_range: range mapped to [0, 255], values outside of it
+        are clipped. The range of ``result`` is used if not set.
+    :return: uint8 alpha of shape (height, width).
+    """
+    mask = result.detach().reshape(result.shape[-2:]).float().cpu()
+    mi, ma = value_range or mask_range(mask)
+    if ma <= mi:
+        return np.zeros(tuple(im_size), dtype=np.uint8)
+    mask = mask.sub(mi).mul_(255 / (ma - mi)).clamp_(0, 255).round_()
+    return _upscale(mask.to(torch.uint8).numpy(), *im_size)
+
+
+def preprocess_image3(
+    image: np.ndarray,
+    size: Sequence[int],
+    out: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
+    """
+    Converts an image to the unnormalized input used to keep shadows.
+
+    :param image: RGB uint8 image.
+    :param size: [height, width] of the model input.
+    :param out: tensor to write into, see :func:`preprocess_image`.
+    :return: tensor of shape (1, 3, height, width) in range [0, 1].
+    """
+    return preprocess_image(image, size, mean=0, std=1, out=out)
+
+
+def postprocess_image3(
+    tensor: torch.Tensor, original_size: Sequence[int]
+) -> np.ndarray:
+    """
+    Converts unnormalized model output to uint8 alpha of the original image.
+
+    :param tensor: model output of shape (1, h, w) in range [0, 1].
+    :param original_size: (width, height) of the original image.
+    :return: uint8 alpha of shape (height, width).
+    """
+    mask = tensor.detach().reshape(tensor.shape[-2:]).float().cpu()
+    mask = mask.mul(255).clamp_(0, 255).to(torch.uint8).numpy()
+    width, height = original_size
+    return _upscale(mask, height, width)
@@ -0,0 +1,245 @@
+"""
+Int8 variant of BriaRMBG for CPU inference.
+
+The ONNX export of BriaRMBG is statically quantized with onnxruntime
+using images from a local folder for calibration.
+Masks of the quantized model are then compared with the fp32 model
+and the variant is only accepted if IoU and MAE stay within
+``quantization_min_iou`` and ``quantization_max_mae``::
+
+    python -m background_changer.utils.quantization --images calibration/
+
+The accepted variant is enabled with ``bria_backend=onnx_int8``.
+Like the export, quantization needs the ``onnx`` package.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from background_changer.settings import settings
+
+from .onnx_backend import OnnxBriaRMBG, default_onnx_path, export_bria_rmbg
+from .pipeline import decode_image
+from .preprocessing import preprocess_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def mask_iou(mask: np.ndarray, reference: np.ndarray, threshold: float = 0.5) -> float:
+    """
+    Intersection over union of two binarized masks.
+
+    :param mask: mask in range [0, 1].
+    :param reference: reference mask in range [0, 1].
+    :param threshold: binarization threshold.
+    :return: IoU, 1.0 if both masks are empty.
+    """
+    mask_bin = mask > threshold
+    reference_bin = reference > threshold
+    union = np.logical_or(mask_bin, reference_bin).sum()
+    if not union:
+        return 1.0
+    return float(np.logical_and(mask_bin, reference_bin).sum() / union)
+
+
+def mask_mae(mask: np.ndarray, reference: np.ndarray) -> float:
+    """
+    Mean absolute error between two soft masks.
+
+    :param mask: mask in range [0, 1].
+    :param reference: reference mask in range [0, 1].
+    :return: MAE.
+    """
+    return float(np.abs(mask.astype(np.float32) - reference.astype(np.float32)).mean())
+
+
+def int8_path(fp32_path: Optional[Path] = None) -> Path:
+    """
+    Path of the quantized model.
+
+    :param fp32_path: path of the fp32 ONNX model.
+    :return: path of the int8 ONNX model.
+    """
+    fp32_path = fp32_path or default_onnx_path()
+    return fp32_path.with_name(f"{fp32_path.stem}.int8.onnx")
+
+
+def report_path(model_path: Path) -> Path:
+    """
+    Path of the accuracy report of a quantized model.
+
+    :param model_path: path of the int8 model.
+    :return: path of the json report.
+    """
+    return model_path.with_suffix(".json")
+
+
+def _list_images(folder: Path) -> List[Path]:
+    return sorted(
+        path for path in folder.iterdir() if path.suffix.lower() in IMAGE_EXTENSIONS
+    )
+
+
+def _model_inputs(images: List[Path], input_size: int) -> Iterator[np.ndarray]:
+    for path in images:
+        # Grayscale, palette and RGBA images are converted like requests are.
+        with path.open("rb") as source:
+            image = decode_image(source)
+        yield preprocess_image(image, [input_size, input_size]).numpy()
+
+
+class _CalibrationReader:
+    """Feeds calibration images to onnxruntime quantizer."""
+
+    def __init__(self, images: List[Path], input_size: int, input_name: str) -> None:
+        self._inputs = _model_inputs(images, input_size)
+        self._input_name = input_name
+
+    def get_next(self) -> Optional[dict[str, np.ndarray]]:
+        tensor = next(self._inputs, None)
+        if tensor is None:
+            return None
+        return {self._input_name: tensor}
+
+
+def evaluate(
+    model: OnnxBriaRMBG,
+    reference: OnnxBriaRMBG,
+    images: List[Path],
+    input_size: int,
+) -> dict[str, float]:
+    """
+    Compares masks of a model against a reference model.
+
+    :param model: evaluated model.
+    :param reference: reference model.
+    :param images: evaluation images.
+    :param input_size: model input size.
+    :return: mean and worst IoU and MAE.
+    """
+    import torch  # noqa: WPS433
+
+    ious, maes = [], []
+    for tensor in _model_inputs(images, input_size):
+        image = torch.from_numpy(tensor)
+        mask = model.forward_mask(image).numpy()
+        expected = reference.forward_mask(image).numpy()
+        ious.append(mask_iou(mask, expected))
+        maes.append(mask_mae(mask, expected))
+    return {
+        "iou": float(np.mean(ious)),
+        "min_iou": float(np.min(ious)),
+        "mae": float(np.mean(maes)),
+        "max_mae": float(np.max(maes)),
+    }
+
+
+def is_accepted(report: dict[str, float]) -> bool:
+    """
+    Checks a quality report against the configured thresholds.
+
+    :param report: report created by :func:`evaluate`.
+    :return: True if int8 model can be used.
+    """
+    return (
+        report["iou"] >= settings.quantization_min_iou
+        and report["mae"] <= settings.quantization_max_mae
+    )
+
+
+def quantize_bria_rmbg(
+    calibration_images: Path,
+    evaluation_images: Optional[Path] = None,
+    input_size: int = 1024,
+) -> dict[str, float]:
+    """
+    Quantizes BriaRMBG to int8 and checks its accuracy.
+
+    The quantized model is removed if it doesn't pass the accuracy gate.
+
+    :param calibration_images: folder with calibration images.
+    :param evaluation_images: folder with evaluation images,
+        calibration images are used if not set.
+    :param input_size: model input size.
+    :raises ValueError: if there are no images in the folder.
+    :return: accuracy report.
+    """
+    from onnxruntime.quantization import (  # noqa: WPS433
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+
+    calibration = _list_images(calibration_images)
+    evaluation = _list_images(evaluation_images or calibration_images)
+    if not calibration or not evaluation:
+        raise ValueError("No images found for calibration or evaluation")
+
+    fp32_path = default_onnx_path()
+    if not fp32_path.exists():
+        export_bria_rmbg(fp32_path)
+    reference = OnnxBriaRMBG(fp32_path)
+    output_path = int8_path(fp32_path)
+
+    quantize_static(
+        str(fp32_path),
+        str(output_path),
+        _CalibrationReader(calibration, input_size, reference.input_name),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    report = evaluate(OnnxBriaRMBG(output_path), reference, evaluation, input_size)
+    report["accepted"] = is_accepted(report)
+    report_path(output_path).write_text(json.dumps(report, indent=2))
+    if not report["accepted"]:
+        output_path.unlink()
+        logger.error(f"Int8 model rejected: {report}")
+    else:
+        logger.info(f"Int8 model accepted: {report}")
+    return report
+
+
+def load_bria_onnx_int8() -> OnnxBriaRMBG:
+    """
+    Loads the int8 BriaRMBG if it passed the accuracy gate.
+
+    :raises RuntimeError: if there is no accepted int8 model.
+    :return: onnxruntime model.
+    """
+    model_path = int8_path()
+    report_file = report_path(model_path)
+    if not model_path.exists() or not report_file.exists():
+        raise RuntimeError(
+            f"Int8 model {model_path} not found, "
+            "run python -m background_changer.utils.quantization first",
+        )
+    report = json.loads(report_file.read_text())
+    if not is_accepted(report):
+        raise RuntimeError(f"Int8 model doesn't meet accuracy thresholds: {report}")
+    return OnnxBriaRMBG(model_path)
+
+
+def main() -> None:
+    """Quantizes BriaRMBG."""
+    parser = argparse.ArgumentParser(description="Quantize BriaRMBG to int8.")
+    parser.add_argument("--images", type=Path, required=True)
+    parser.add_argument("--eval-images", type=Path, default=None)
+    parser.add_argument("--input-size", type=int, default=1024)
+    args = parser.parse_args()
+    report = quantize_bria_rmbg(args.images, args.eval_images, args.input_size)
+    if not report["accepted"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+from typing import Callable
+
+import cv2
+import numpy as np
+
+from background_changer.settings import settings
+
+
+def uncertain_band(alpha: np.ndarray, low: int, high: int) -> np.ndarray:
+    """
+    Marks pixels where the mask is neither foreground nor background.
+
+    :param alpha: uint8 alpha of shape (H, W).
+    :param low: alpha values above it are not background.
+    :param high: alpha values below it are not foreground.
+    :return: boolean mask of shape (H, W).
+    """
+    return (alpha > low) & (alpha < high)
+
+
+def select_tiles(band: np.ndarray, tile_size: int, min_fraction: float) -> np.ndarray:
+    """
+    Finds tiles that contain enough uncertain pixels.
+
+    :param band: boolean uncertain band of shape (H, W).
+    :param tile_size: side of a square tile in pixels.
+    :param min_fraction: minimal share of uncertain pixels in a tile.
+    :return: (row, column) indices of selected tiles.
+    """
+    height, width = band.shape
+    rows = -(-height // tile_size)
+    cols = -(-width // tile_size)
+    padded = np.zeros((rows * tile_size, cols * tile_size), dtype=bool)
+    padded[:height, :width] = band
+    counts = padded.reshape(rows, tile_size, cols, tile_size).sum(
+        axis=(1, 3),
+        dtype=np.uint32,
+    )
+    return np.argwhere(counts > min_fraction * tile_size * tile_size)
+
+
+def refine_edges(
+    image: np.ndarray,
+    alpha: np.ndarray,
+    segment: Callable[[np.ndarray], np.ndarray],
+    tile_size: int = 0,
+) -> np.ndarray:
+    """
+    Re-segments only the uncertain boundary of a coarse mask.
+
+    The image is split into square tiles. Tiles where the coarse
+    alpha has enough pixels between ``refine_low`` and ``refine_high``
+    are segmented again, with some context around them, at the resolution
+    of the tile instead of the whole image. Refined values are only used
+    inside the (dilated) uncertain band, the rest of the coarse mask
+    is kept, so tiles never introduce seams in solid areas.
+
+    :param image: RGB image of shape (H, W, 3).
+    :param alpha: coarse uint8 alpha of shape (H, W).
+    :param segment: returns uint8 alpha for an RGB crop, at crop resolution.
+    :param tile_size: side of a tile, ``refine_tile_size`` if not set.
+    :return: refined uint8 alpha of shape (H, W).
+    """
+    tile_size = tile_size or settings.refine_tile_size
+    context = tile_size // 4
+    band = uncertain_band(alpha, settings.refine_low, settings.refine_high)
+    band = cv2.dilate(band.astype(np.uint8), np.ones((9, 9), np.uint8)).astype(bool)
+    tiles = select_tiles(band, tile_size, settings.refine_min_fraction)
+    height, width = alpha.shape
+    refined = alpha.copy()
+    for row, col in tiles:
+        top, left = row * tile_size, col * tile_size
+        bottom, right = min(top + tile_size, height), min(left + tile_size, width)
+        crop_top, crop_left = max(top - context, 0), max(left - context, 0)
+        crop_bottom = min(bottom + context, height)
+        crop_right = min(right + context, width)
+        tile_alpha = segment(image[crop_top:crop_bottom, crop_left:crop_right])
+        inner = tile_alpha[
+            top - crop_top : bottom - crop_top,
+            left - crop_left : right - crop_left,
+        ]
+        tile_band = band[top:bottom, left:right]
+        refined[top:bottom, left:right][tile_band] = inner[tile_band]
+    return refined
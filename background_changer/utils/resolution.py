@@ -0,0 +1,42 @@
+import enum
+from typing import Optional, Sequence
+
+from background_changer.settings import settings
+
+
+class QualityTier(str, enum.Enum):  # noqa: WPS600
+    """Requested quality of the segmentation mask."""
+
+    PREVIEW = "preview"
+    STANDARD = "standard"
+    HIGH = "high"
+
+
+def choose_input_size(
+    image_size: Sequence[int],
+    quality: Optional[QualityTier] = None,
+) -> list[int]:
+    """
+    Chooses model input resolution for an image.
+
+    Explicit quality tier maps to one of ``model_input_sizes``
+    (preview - the smallest, high - the largest).
+    Without a tier the smallest size that is not smaller than
+    the longest side of the image is used, so thumbnails
+    are not upscaled to the full model resolution.
+
+    :param image_size: (height, width) of the source image.
+    :param quality: requested quality tier.
+    :return: [height, width] of the model input.
+    """
+    sizes = sorted(settings.model_input_sizes)
+    if quality == QualityTier.PREVIEW:
+        size = sizes[0]
+    elif quality == QualityTier.STANDARD:
+        size = sizes[len(sizes) // 2]
+    elif quality == QualityTier.HIGH:
+        size = sizes[-1]
+    else:
+        longest_side = max(image_size[:2])
+        size = next((size for size in sizes if size >= longest_side), sizes[-1])
+    return [size, size]
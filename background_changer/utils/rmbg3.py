@@ -1,54 +1,98 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
 import torch
 from PIL import Image
-from torchvision.models.detection import fasterrcnn_resnet50_fpn
 from torchvision.transforms import functional as F
 
+from background_changer.settings import settings
 
-def detect_car_and_remove_bg(input_path, output_path):
-    # Load the pre-trained Faster R-CNN model
-    model = fasterrcnn_resnet50_fpn(pretrained=True)
-    model.eval()
+from .inference import inference_context
+from .model_registry import CAR_DETECTOR, get_device, model_registry
 
-    # Load the image
-    image = Image.open(input_path).convert("RGB")
-    image_tensor = F.to_tensor(image).unsqueeze(0)
-
-    # Perform inference
-    with torch.no_grad():
-        prediction = model(image_tensor)
-
-    # Get the highest confidence bounding box
-    boxes = prediction[0]["boxes"]
-    scores = prediction[0]["scores"]
-    high_confidence_idx = scores.argmax()
-    print("boxes:", boxes)
-
-    car_box = boxes[high_confidence_idx].numpy().astype(int)
-    print("Car scores:", scores)
-    print("Car detected at:", car_box)
-    max_area = 0
-    largest_box = None
-    for box in boxes:
-        x1, y1, x2, y2 = box
-        area = (x2 - x1) * (y2 - y1)
-        if area > max_area:
-            max_area = area
-            largest_box = box.numpy().astype(int)
-
-    print("Largest car detected at:", largest_box)
-
-    # Crop the image to the largest_box
-    cropped_image = image.crop(
-        (largest_box[0], largest_box[1], largest_box[2], largest_box[3]),
+Box = Tuple[int, int, int, int]
+
+
+def select_largest_box(
+    boxes: torch.Tensor,
+    scores: torch.Tensor,
+    labels: torch.Tensor,
+) -> Optional[torch.Tensor]:
+    """
+    Picks the largest confident vehicle box of a detection.
+
+    :param boxes: boxes of shape (N, 4) as x1, y1, x2, y2.
+    :param scores: scores of shape (N,).
+    :param labels: COCO labels of shape (N,).
+    :return: box of shape (4,) or None if nothing was detected.
+    """
+    keep = scores >= settings.detector_min_score
+    if settings.detector_labels:
+        keep &= torch.isin(labels, torch.tensor(settings.detector_labels))
+    boxes = boxes[keep]
+    if not len(boxes):
+        return None
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return boxes[areas.argmax()]
+
+
+def detect_car(image: np.ndarray) -> Optional[Box]:
+    """
+    Finds the car on an image with the cached Faster R-CNN detector.
+
+    The detector works on an image downscaled to ``detector_max_size``,
+    it resizes its input to 800 pixels anyway.
+
+    :param image: RGB uint8 image of shape (H, W, 3).
+    :return: (left, top, right, bottom) in image pixels or None.
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, settings.detector_max_size / max(height, width))
+    if scale < 1:
+        image = cv2.resize(
+            image,
+            (round(width * scale), round(height * scale)),
+            interpolation=cv2.INTER_AREA,
+        )
+    model = model_registry.get(CAR_DETECTOR)
+    with inference_context():
+        prediction = model([F.to_tensor(image).to(get_device())])[0]
+    box = select_largest_box(
+        prediction["boxes"].float().cpu(),
+        prediction["scores"].float().cpu(),
+        prediction["labels"].cpu(),
+    )
+    if box is None:
+        return None
+    left, top, right, bottom = (box / scale).round().int().tolist()
+    return max(left, 0), max(top, 0), min(right, width), min(bottom, height)
+
+
+def pad_box(box: Box, image_size: Tuple[int, int], padding: float) -> Box:
+    """
+    Grows a box by a share of its size, clipped to the image.
+
+    :param box: (left, top, right, bottom).
+    :param image_size: (height, width) of the image.
+    :param padding: share of box width and height added on every side.
+    :return: padded box.
+    """
+    left, top, right, bottom = box
+    height, width = image_size
+    pad_x = round((right - left) * padding)
+    pad_y = round((bottom - top) * padding)
+    return (
+        max(left - pad_x, 0),
+        max(top - pad_y, 0),
+        min(right + pad_x, width),
+        min(bottom + pad_y, height),
     )
-    cropped_image.save(output_path)
-    # Since rembg removes the background from the entire image,
-    # we first remove the background.
-    # bg_removed_image = remove(image.tobytes(), alpha_matting=True)
 
-    # Convert the result back to PIL Image for further processing or saving
-    # bg_removed_image_pil = Image.open(io.BytesIO(bg_removed_image))
 
-    # Optionally, you can save or display the image
-    # bg_removed_image_pil.save(output_path)
-    # bg_removed_image_pil.show()
+def detect_car_and_remove_bg(input_path, output_path):
+    image = Image.open(input_path).convert("RGB")
+    box = detect_car(np.asarray(image))
+    if box is not None:
+        image = image.crop(box)
+    image.save(output_path)
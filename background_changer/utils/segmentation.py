@@ -0,0 +1,545 @@
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from importlib import import_module
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from loguru import logger
+from PIL import Image
+
+from background_changer.settings import settings
+
+from .batching import run_bria, run_bria_batch
+from .inference import inference_context
+from .masks import clean_mask, cutout
+from .matting import matte
+from .model_registry import REMBG, TRANSFORMERS_RMBG, get_device, model_registry
+from .preprocessing import (
+    input_buffer,
+    mask_range,
+    postprocess_image,
+    postprocess_image3,
+    preprocess_image,
+    preprocess_image3,
+)
+from .refinement import refine_edges
+from .resolution import QualityTier, choose_input_size
+from .rmbg3 import Box, detect_car, pad_box
+from .session_pool import rembg_pool_size
+
+
+class SegmentationBackend(ABC):
+    """
+    Base class of segmentation backends.
+
+    A backend takes a decoded RGB image and returns its alpha mask.
+    File I/O and model lifecycle are not backend's concern,
+    models are taken from the model registry.
+    """
+
+    # Whether ``model`` of :meth:`segment` selects a model variant.
+    has_model_variants = False
+
+    @abstractmethod
+    def segment(
+        self,
+        image: np.ndarray,
+        quality: Optional[QualityTier] = None,
+        model: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Computes alpha mask of the foreground.
+
+        :param image: RGB uint8 image of shape (H, W, 3).
+        :param quality: requested quality tier, backends may ignore it.
+        :param model: requested model variant, backends without variants
+            log it with :meth:`warn_unused_model` and ignore it.
+        :return: uint8 alpha of shape (H, W).
+        """
+
+    def parallel_segmentations(self) -> int:
+        """
+        Number of images the backend segments at once without oversubscription.
+
+        Every segmentation already runs on the intra-op threads
+        of its inference session, so callers that segment images
+        in parallel shouldn't run more threads than this.
+
+        :return: number of concurrent segmentations.
+        """
+        return 1
+
+    def segment_batch(
+        self,
+        images: Sequence[np.ndarray],
+        quality: Optional[QualityTier] = None,
+        model: Optional[str] = None,
+    ) -> List[np.ndarray]:
+        """
+        Computes alpha masks of several images.
+
+        Backends that run images as one forward pass override it,
+        others segment the images one by one.
+
+        :param images: RGB uint8 images, they may differ in size.
+        :param quality: requested quality tier, backends may ignore it.
+        :param model: requested model variant.
+        :return: uint8 alphas in the order of the images.
+        """
+        return [self.segment(image, quality, model) for image in images]
+
+    def max_batch_size(self) -> int:
+        """
+        Number of images worth passing to :meth:`segment_batch` at once.
+
+        :return: 1 for backends that segment images one by one.
+        """
+        return 1
+
+    def warn_unused_model(self, model: Optional[str]) -> None:
+        """
+        Logs a requested model variant the backend has no use for.
+
+        :param model: requested model variant.
+        """
+        if model is not None:
+            logger.warning(f"{type(self).__name__} ignores requested model {model}")
+
+
+class RembgBackend(SegmentationBackend):
+    """
+    rembg session.
+
+    The mask is computed once and cleaned up on the array level.
+    ``rembg_passes`` > 1 segments the cutout again, the same way
+    as running rembg on its own output. ``model`` selects the rembg
+    model, ``rembg_model`` is used if it's not set.
+    """
+
+    has_model_variants = True
+
+    def segment(
+        self,
+        image: np.ndarray,
+        quality: Optional[QualityTier] = None,
+        model: Optional[str] = None,
+    ) -> np.ndarray:
+        from rembg import remove  # noqa: WPS433
+
+        pool = model_registry.get(REMBG).get(model or settings.rembg_model)
+        with pool.checkout() as session:
+            alpha = remove(image, session=session, only_mask=True)
+            for _ in range(1, settings.rembg_passes):
+                foreground = cutout(image, alpha)[:, :, :3]
+                mask = remove(foreground, session=session, only_mask=True)
+                alpha = (alpha.astype(np.uint16) * mask + 127) // 255
+                alpha = alpha.astype(np.uint8)
+        return clean_mask(np.ascontiguousarray(alpha))
+
+    def parallel_segmentations(self) -> int:
+        """
+        One segmentation per pooled session.
+
+        :return: number of rembg sessions of the worker.
+        """
+        return rembg_pool_size()
+
+
+def bria_parallel_segmentations() -> int:
+    """
+    Number of images BriaRMBG segments at once.
+
+    Concurrent requests are merged into one forward pass when
+    ``inference_batching`` is enabled, otherwise every forward pass
+    uses all intra-op threads of the worker.
+
+    :return: ``inference_max_batch_size`` with batching, 1 otherwise.
+    """
+    if settings.inference_batching:
+        return settings.inference_max_batch_size
+    return 1
+
+
+def segment_bria(
+    image: np.ndarray,
+    model_input_size: list,
+    value_range: Optional[Tuple[float, float]] = None,
+) -> np.ndarray:
+    """
+    Computes BriaRMBG alpha for an image.
+
+    :param image: RGB image of shape (H, W, 3).
+    :param model_input_size: [height, width] of the model input.
+    :param value_range: range of the model output mapped to [0, 255],
+        the output is min-max normalized if not set.
+    :return: uint8 alpha of shape (H, W).
+    """
+    with input_buffer(*model_input_size) as buffer:
+        tensor = preprocess_image(image, model_input_size, out=buffer)
+        mask = run_bria(tensor.to(get_device()))
+    return postprocess_image(mask, image.shape[:2], value_range)
+
+
+def segment_bria_batch(
+    images: Sequence[np.ndarray],
+    model_input_size: list,
+) -> List[np.ndarray]:
+    """
+    Computes BriaRMBG alphas of several images in one forward pass.
+
+    Every mask is normalized with its own range, as by :func:`segment_bria`.
+
+    :param images: RGB images.
+    :param model_input_size: [height, width] of the model input.
+    :return: uint8 alphas in the order of the images.
+    """
+    with input_buffer(*model_input_size, batch_size=len(images)) as buffer:
+        for index, image in enumerate(images):
+            preprocess_image(image, model_input_size, out=buffer[index : index + 1])
+        masks = run_bria_batch(buffer.to(get_device()))
+    return [
+        postprocess_image(mask, image.shape[:2]) for mask, image in zip(masks, images)
+    ]
+
+
+def segment_bria_shadows_batch(
+    images: Sequence[np.ndarray],
+    model_input_size: list,
+) -> List[np.ndarray]:
+    """
+    Computes unnormalized BriaRMBG alphas of several images in one forward pass.
+
+    :param images: RGB images.
+    :param model_input_size: [height, width] of the model input.
+    :return: uint8 alphas in the order of the images.
+    """
+    with input_buffer(*model_input_size, batch_size=len(images)) as buffer:
+        for index, image in enumerate(images):
+            preprocess_image3(image, model_input_size, out=buffer[index : index + 1])
+        masks = run_bria_batch(buffer.to(get_device()))
+    return [
+        postprocess_image3(mask, (image.shape[1], image.shape[0]))
+        for mask, image in zip(masks, images)
+    ]
+
+
+def _segment_by_input_size(
+    images: Sequence[np.ndarray],
+    quality: Optional[QualityTier],
+    segment_batch: Callable[[List[np.ndarray], list], List[np.ndarray]],
+) -> List[np.ndarray]:
+    """
+    Segments images that share a model input size as one batch.
+
+    :param images: RGB images.
+    :param quality: requested quality tier.
+    :param segment_batch: segments images of the given model input size.
+    :return: uint8 alphas in the order of the images.
+    """
+    groups: Dict[Tuple[int, ...], List[int]] = {}
+    for index, image in enumerate(images):
+        size = choose_input_size(image.shape[:2], quality)
+        groups.setdefault(tuple(size), []).append(index)
+    alphas: List[np.ndarray] = [np.empty(0, dtype=np.uint8)] * len(images)
+    for size, indices in groups.items():
+        group = segment_batch([images[index] for index in indices], list(size))
+        for index, alpha in zip(indices, group):
+            alphas[index] = alpha
+    return alphas
+
+
+def segment_bria_refined(image: np.ndarray) -> np.ndarray:
+    """
+    Two-stage BriaRMBG segmentation for large images.
+
+    The whole image is segmented at the smallest model input size,
+    then only tiles on the uncertain boundary are segmented again
+    at the resolution of the tile. Tiles are normalized with the output
+    range of the whole image: min-max normalizing a tile of mostly
+    background on its own would stretch it to foreground.
+
+    :param image: RGB image of shape (H, W, 3).
+    :return: uint8 alpha of shape (H, W).
+    """
+    coarse_size = min(settings.model_input_sizes)
+    with input_buffer(coarse_size, coarse_size) as buffer:
+        tensor = preprocess_image(image, [coarse_size, coarse_size], out=buffer)
+        mask = run_bria(tensor.to(get_device()))
+    value_range = mask_range(mask)
+    alpha = postprocess_image(mask, image.shape[:2], value_range)
+    return refine_edges(
+        image,
+        alpha,
+        lambda tile: segment_bria(
+            tile,
+            choose_input_size(tile.shape[:2]),
+            value_range,
+        ),
+    )
+
+
+def _needs_refinement(image: np.ndarray, quality: Optional[QualityTier]) -> bool:
+    return (
+        settings.edge_refinement
+        and quality != QualityTier.PREVIEW
+        and max(image.shape[:2]) > max(settings.model_input_sizes)
+    )
+
+
+class BriaBackend(SegmentationBackend):
+    """BriaRMBG with adaptive resolution and optional edge refinement."""
+
+    def segment(
+        self,
+        image: np.ndarray,
+        quality: Optional[QualityTier] = None,
+        model: Optional[str] = None,
+    ) -> np.ndarray:
+        self.warn_unused_model(model)
+        if _needs_refinement(image, quality):
+            return segment_bria_refined(image)
+        return segment_bria(image, choose_input_size(image.shape[:2], quality))
+
+    def segment_batch(
+        self,
+        images: Sequence[np.ndarray],
+        quality: Optional[QualityTier] = None,
+        model: Optional[str] = None,
+    ) -> List[np.ndarray]:
+        """
+        Runs images of the same model input size as one forward pass.
+
+        Images that need edge refinement are segmented one by one.
+
+        :param images: RGB uint8 images.
+        :param quality: requested quality tier.
+        :param model: requested model variant, logged and ignored.
+        :return: uint8 alphas in the order of the images.
+        """
+        self.warn_unused_model(model)
+        refined = [_needs_refinement(image, quality) for image in images]
+        batched = iter(
+            _segment_by_input_size(
+                [image for image, refine in zip(images, refined) if not refine],
+                quality,
+                segment_bria_batch,
+            ),
+        )
+        return [
+            segment_bria_refined(image) if refine else next(batched)
+            for image, refine in zip(images, refined)
+        ]
+
+    def parallel_segmentations(self) -> int:
+        """
+        Images segmented at once, see :func:`bria_parallel_segmentations`.
+
+        :return: number of concurrent segmentations.
+        """
+        return bria_parallel_segmentations()
+
+    def max_batch_size(self) -> int:
+        """
+        Images of a single forward pass of :meth:`segment_batch`.
+
+        :return: ``inference_max_batch_size``.
+        """
+        return settings.inference_max_batch_size
+
+
+class BriaShadowsBackend(SegmentationBackend):
+    """BriaRMBG on unnormalized input, keeps soft shadows in the mask."""
+
+    def segment(
+        self,
+        image: np.ndarray,
+        quality: Optional[QualityTier] = None,
+        model: Optional[str] = None,
+    ) -> np.ndarray:
+        self.warn_unused_model(model)
+        height, width = image.shape[:2]
+        model_input_size = choose_input_size((height, width), quality)
+        with input_buffer(*model_input_size) as buffer:
+            tensor = preprocess_image3(image, model_input_size, out=buffer)
+            mask = run_bria(tensor.to(get_device()))
+        return postprocess_image3(mask[0], (width, height))
+
+    def segment_batch(
+        self,
+        images: Sequence[np.ndarray],
+        quality: Optional[QualityTier] = None,
+        model: Optional[str] = None,
+    ) -> List[np.ndarray]:
+        """
+        Runs images of the same model input size as one forward pass.
+
+        :param images: RGB uint8 images.
+        :param quality: requested quality tier.
+        :param model: requested model variant, logged and ignored.
+        :return: uint8 alphas in the order of the images.
+        """
+        self.warn_unused_model(model)
+        return _segment_by_input_size(images, quality, segment_bria_shadows_batch)
+
+    def parallel_segmentations(self) -> int:
+        """
+        Images segmented at once, see :func:`bria_parallel_segmentations`.
+
+        :return: number of concurrent segmentations.
+        """
+        return bria_parallel_segmentations()
+
+    def max_batch_size(self) -> int:
+        """
+        Images of a single forward pass of :meth:`segment_batch`.
+
+        :return: ``inference_max_batch_size``.
+        """
+        return settings.inference_max_batch_size
+
+
+class TransformersBackend(SegmentationBackend):
+    """RMBG through transformers AutoModelForImageSegmentation."""
+
+    def segment(
+        self,
+        image: np.ndarray,
+        quality: Optional[QualityTier] = None,
+        model: Optional[str] = None,
+    ) -> np.ndarray:
+        self.warn_unused_model(model)
+        feature_extractor, rmbg_model = model_registry.get(TRANSFORMERS_RMBG)
+        inputs = feature_extractor(images=Image.fromarray(image), return_tensors="pt")
+        with inference_context():
+            outputs = rmbg_model(**inputs)
+        probs = torch.nn.functional.softmax(outputs.logits[0], dim=0)[1]
+        mask = (probs > 0.5).mul(255).byte().cpu().numpy()
+        mask = Image.fromarray(mask).resize(
+            (image.shape[1], image.shape[0]),
+            resample=Image.BILINEAR,
+        )
+        # The model predicts background as the positive class.
+        return 255 - np.asarray(mask)
+
+
+def segment_image(
+    backend: SegmentationBackend,
+    image: np.ndarray,
+    quality: Optional[QualityTier] = None,
+    model: Optional[str] = None,
+) -> np.ndarray:
+    """
+    Segments an image, only inside the detected car if ``detector_roi`` is set.
+
+    Segmenting the padded box of the car spends the model input
+    resolution on the car instead of the whole frame. The mask
+    of the box is pasted back, everything outside is background.
+    Images without a detected car are segmented as a whole.
+    With ``alpha_matting`` the edges of the mask are matted.
+
+    :param backend: segmentation backend.
+    :param image: RGB uint8 image of shape (H, W, 3).
+    :param quality: requested quality tier.
+    :param model: requested model variant.
+    :return: uint8 alpha of shape (H, W).
+    """
+    box = _car_box(image)
+    alpha = backend.segment(_crop(image, box), quality, model)
+    return _finish_alpha(image, box, alpha)
+
+
+def segment_images(
+    backend: SegmentationBackend,
+    images: Sequence[np.ndarray],
+    quality: Optional[QualityTier] = None,
+    model: Optional[str] = None,
+) -> List[np.ndarray]:
+    """
+    Segments several images like :func:`segment_image`.
+
+    The images, or the boxes of their cars, are passed
+    to :meth:`SegmentationBackend.segment_batch` at once.
+
+    :param backend: segmentation backend.
+    :param images: RGB uint8 images.
+    :param quality: requested quality tier.
+    :param model: requested model variant.
+    :return: uint8 alphas in the order of the images.
+    """
+    boxes = [_car_box(image) for image in images]
+    alphas = backend.segment_batch(
+        [_crop(image, box) for image, box in zip(images, boxes)],
+        quality,
+        model,
+    )
+    return [
+        _finish_alpha(image, box, alpha)
+        for image, box, alpha in zip(images, boxes, alphas)
+    ]
+
+
+def _car_box(image: np.ndarray) -> Optional[Box]:
+    box = detect_car(image) if settings.detector_roi else None
+    if box is None:
+        return None
+    return pad_box(box, image.shape[:2], settings.roi_padding)
+
+
+def _crop(image: np.ndarray, box: Optional[Box]) -> np.ndarray:
+    if box is None:
+        return image
+    left, top, right, bottom = box
+    return np.ascontiguousarray(image[top:bottom, left:right])
+
+
+def _finish_alpha(
+    image: np.ndarray,
+    box: Optional[Box],
+    alpha: np.ndarray,
+) -> np.ndarray:
+    """
+    Pastes the alpha of the car box back and mattes its edges.
+
+    :param image: RGB image.
+    :param box: padded box of the car, None if the whole image was segmented.
+    :param alpha: alpha of the box or of the whole image.
+    :return: uint8 alpha of the image.
+    """
+    if box is not None:
+        left, top, right, bottom = box
+        box_alpha = alpha
+        alpha = np.zeros(image.shape[:2], dtype=np.uint8)
+        alpha[top:bottom, left:right] = box_alpha
+    if settings.alpha_matting:
+        alpha = matte(image, alpha)
+    return alpha
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: str) -> SegmentationBackend:
+    """
+    Returns segmentation backend registered in settings.
+
+    :param name: name of the backend in ``segmentation_backends``.
+    :raises KeyError: if backend is not registered.
+    :return: backend instance.
+    """
+    if name not in settings.segmentation_backends:
+        raise KeyError(f"Segmentation backend {name!r} is not registered")
+    module_name, class_name = settings.segmentation_backends[name].rsplit(".", 1)
+    return getattr(import_module(module_name), class_name)()
+
+
+def check_model_supported(backend: str, model: Optional[str]) -> None:
+    """
+    Checks that a requested model variant can be used by the backend.
+
+    :param backend: name of the backend in ``segmentation_backends``.
+    :param model: requested model variant or None for the default one.
+    :raises ValueError: if model is set and backend has no model variants.
+    """
+    if model is not None and not get_backend(backend).has_model_variants:
+        raise ValueError(
+            f"Segmentation backend {backend!r} doesn't support model selection",
+        )
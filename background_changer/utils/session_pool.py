@@ -0,0 +1,231 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Annotated, Any, Callable, Iterator, Optional, Tuple
+
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram
+from pydantic import AfterValidator
+
+from background_changer.settings import settings
+
+from .inference import worker_cpu_count
+
+CHECKOUT_WAIT = Histogram(
+    "session_pool_checkout_wait_seconds",
+    "Time a caller waited for a free session.",
+    ["pool"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+CHECKOUTS = Counter(
+    "session_pool_checkouts",
+    "Number of session checkouts.",
+    ["pool"],
+)
+IN_USE = Gauge(
+    "session_pool_sessions_in_use",
+    "Number of sessions currently checked out.",
+    ["pool"],
+)
+
+
+class SessionPool:
+    """
+    Bounded pool of inference sessions.
+
+    onnxruntime sessions run every call on their own intra-op thread pool,
+    so a single session shared by all threadpool workers makes
+    concurrent calls fight for the same cores. The pool gives every
+    caller an exclusive session and blocks callers when all sessions
+    are busy. Sessions are created lazily, up to ``size``.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], size: int) -> None:
+        self.name = name
+        self.size = size
+        self._factory = factory
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self) -> Iterator[Any]:
+        """
+        Borrows a session from the pool.
+
+        :yields: session used only by the caller until the context exits.
+        """
+        start = time.perf_counter()
+        session = self._acquire()
+        CHECKOUT_WAIT.labels(self.name).observe(time.perf_counter() - start)
+        CHECKOUTS.labels(self.name).inc()
+        IN_USE.labels(self.name).inc()
+        try:
+            yield session
+        finally:
+            IN_USE.labels(self.name).dec()
+            self._idle.put(session)
+
+    def prefill(self, count: int) -> None:
+        """
+        Creates sessions ahead of the first request.
+
+        :param count: number of sessions to create, capped by pool size.
+        """
+        while True:
+            with self._lock:
+                if self._created >= min(count, self.size):
+                    return
+                self._created += 1
+            self._idle.put(self._create())
+
+    def _acquire(self) -> Any:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if not can_create:
+                return self._idle.get()
+        return self._create()
+
+    def _create(self) -> Any:
+        try:
+            return self._factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+
+class SessionPoolCache:
+    """
+    LRU cache of session pools, one pool per model.
+
+    Keeps at most ``max_models`` pools and drops pools that were not
+    used for ``idle_seconds``. Requests that still hold a session
+    of a dropped pool finish with it, the session is freed afterwards.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], SessionPool],
+        max_models: int,
+        idle_seconds: float = 0,
+    ) -> None:
+        self._factory = factory
+        self._max_models = max(1, max_models)
+        self._idle_seconds = idle_seconds
+        self._pools: "OrderedDict[str, Tuple[SessionPool, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str) -> SessionPool:
+        """
+        Returns pool of a model, creating it if needed.
+
+        :param model_name: name of the model.
+        :return: session pool.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._pools.pop(model_name, None)
+            pool = entry[0] if entry else self._factory(model_name)
+            self._pools[model_name] = (pool, now)
+            while len(self._pools) > self._max_models:
+                evicted, _ = self._pools.popitem(last=False)
+                logger.info(f"Unloaded session pool {evicted}")
+        return pool
+
+    def loaded(self) -> list[str]:
+        """
+        Names of models with a pool, least recently used first.
+
+        :return: model names.
+        """
+        with self._lock:
+            return list(self._pools)
+
+    def _evict_idle(self, now: float) -> None:
+        if not self._idle_seconds:
+            return
+        for model_name, (_, last_used) in list(self._pools.items()):
+            if now - last_used > self._idle_seconds:
+                del self._pools[model_name]
+                logger.info(f"Unloaded idle session pool {model_name}")
+
+
+def check_rembg_model(model_name: Optional[str]) -> Optional[str]:
+    """
+    Validates rembg model requested by a client.
+
+    :param model_name: model name or None for the default model.
+    :raises ValueError: if model is not allowed in settings.
+    :return: same model name.
+    """
+    allowed = {settings.rembg_model, *settings.rembg_models}
+    if model_name is not None and model_name not in allowed:
+        raise ValueError(
+            f"Unknown rembg model {model_name!r}, "
+            f"choose one of {', '.join(sorted(allowed))}",
+        )
+    return model_name
+
+
+RembgModelName = Annotated[str, AfterValidator(check_rembg_model)]
+
+
+def rembg_pool_size() -> int:
+    """
+    Number of rembg sessions of a worker.
+
+    :return: ``rembg_pool_size`` or one session per two cores, at most four.
+    """
+    return settings.rembg_pool_size or max(1, min(4, worker_cpu_count() // 2))
+
+
+def new_rembg_session(model_name: str) -> Any:
+    """
+    Creates rembg session with explicit onnxruntime threading.
+
+    ``rembg.new_session`` only reads ``OMP_NUM_THREADS``, so the session
+    class is instantiated directly with session options.
+
+    :param model_name: name of the rembg model.
+    :raises ValueError: if rembg doesn't know the model.
+    :return: rembg session.
+    """
+    import onnxruntime as ort  # noqa: WPS433
+    from rembg.sessions import sessions_class  # noqa: WPS433
+
+    session_class = next(
+        (cls for cls in sessions_class if cls.name() == model_name),
+        None,
+    )
+    if session_class is None:
+        raise ValueError(f"Unknown rembg model {model_name!r}")
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = settings.rembg_intra_op_threads or max(
+        1,
+        worker_cpu_count() // rembg_pool_size(),
+    )
+    options.inter_op_num_threads = settings.rembg_inter_op_threads
+    return session_class(model_name, options)
+
+
+def rembg_session_pool(model_name: str) -> SessionPool:
+    """
+    Creates pool of rembg sessions of a model.
+
+    :param model_name: name of the rembg model.
+    :return: session pool, sessions are created on first checkout.
+    """
+    return SessionPool(
+        f"rembg_{model_name}",
+        lambda: new_rembg_session(model_name),
+        rembg_pool_size(),
+    )
@@ -0,0 +1,5 @@
+"""Background library API."""
+
+from background_changer.web.api.backgrounds.views import router
+
+__all__ = ["router"]
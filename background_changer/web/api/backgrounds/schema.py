@@ -0,0 +1,39 @@
+from pydantic import AnyHttpUrl, BaseModel
+
+
+class RegisterBackgroundByLinkInputDto(BaseModel):
+    """
+    Represents the input data transfer object (DTO)
+    for registering a background by link.
+
+    Attributes:
+        background_link (AnyHttpUrl): The URL link to the background image.
+
+    Examples:
+        input_dto = RegisterBackgroundByLinkInputDto(
+        background_link="https://example.com/background.jpg")
+    """
+
+    background_link: AnyHttpUrl
+
+
+class BackgroundDto(BaseModel):
+    """
+    Represents a registered background.
+
+    Attributes:
+        background_id (str): ID to reference the background with.
+        width (int): Width of the background.
+        height (int): Height of the background.
+        plate_widths (list[int]): Widths the background is stored in,
+        other output widths are resized on request.
+
+    Examples:
+        output_dto = BackgroundDto(background_id="3f2a9c4e1b7d8a60",
+        width=3840, height=2160, plate_widths=[3840, 1920, 1280])
+    """
+
+    background_id: str
+    width: int
+    height: int
+    plate_widths: list[int]
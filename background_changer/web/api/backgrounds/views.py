@@ -0,0 +1,95 @@
+from fastapi import APIRouter, Depends, HTTPException, Path, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from background_changer.services.http.dependency import get_image_downloader
+from background_changer.utils.background_library import (
+    BACKGROUND_ID_PATTERN,
+    background_library,
+)
+from background_changer.utils.downloads import ImageDownloader
+from background_changer.web.api.backgrounds.schema import (
+    BackgroundDto,
+    RegisterBackgroundByLinkInputDto,
+)
+
+router = APIRouter()
+
+BackgroundId = Path(pattern=BACKGROUND_ID_PATTERN)
+
+
+def describe_background(background_id: str) -> BackgroundDto:
+    """
+    Builds the description of a registered background.
+
+    :param background_id: ID of the background.
+    :return: background DTO.
+    """
+    plate = background_library.plate(background_id)
+    return BackgroundDto(
+        background_id=background_id,
+        width=plate.shape[1],
+        height=plate.shape[0],
+        plate_widths=background_library.plate_widths(background_id),
+    )
+
+
+@router.post("/", response_model=BackgroundDto)
+def register_background(background_image: UploadFile) -> BackgroundDto:
+    """
+    Registers an uploaded background.
+
+    :param background_image: background image.
+    :return: registered background.
+    """
+    background_id = background_library.register(background_image.file)
+    return describe_background(background_id)
+
+
+@router.post("/by_link/", response_model=BackgroundDto)
+async def register_background_by_link(
+    payload: RegisterBackgroundByLinkInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
+) -> BackgroundDto:
+    """
+    Registers a background by link.
+
+    :param payload: link of the background.
+    :param downloader: shared image downloader.
+    :return: registered background.
+    """
+    background = await downloader.fetch(str(payload.background_link))
+    with background:
+        background_id = await run_in_threadpool(
+            background_library.register,
+            background,
+        )
+    return describe_background(background_id)
+
+
+@router.get("/{background_id}", response_model=BackgroundDto)
+def get_background(background_id: str = BackgroundId) -> BackgroundDto:
+    """
+    Describes a registered background.
+
+    :param background_id: ID of the background.
+    :raises HTTPException: if background is not registered.
+    :return: registered background.
+    """
+    try:
+        return describe_background(background_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Background not found")
+
+
+@router.delete("/{background_id}", status_code=204)
+def delete_background(background_id: str = BackgroundId) -> None:
+    """
+    Removes a registered background.
+
+    :param background_id: ID of the background.
+    :raises HTTPException: if background is not registered.
+    """
+    try:
+        background_library.delete(background_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Background not found")
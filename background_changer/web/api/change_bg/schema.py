@@ -1,4 +1,9 @@
-from pydantic import AnyHttpUrl, BaseModel, ConfigDict, Field, HttpUrl
+from pydantic import AnyHttpUrl, BaseModel, ConfigDict, Field, HttpUrl, model_validator
+
+from background_changer.settings import settings
+from background_changer.utils.background_library import BACKGROUND_ID_PATTERN
+from background_changer.utils.resolution import QualityTier
+from background_changer.utils.session_pool import RembgModelName
 
 
 class ChangeBgModelDto(BaseModel):
@@ -38,16 +43,61 @@ class ChangeBgPositionModelInputDto(BaseModel):
     scale_factor: float = Field(default=0.50, le=1, ge=0)
 
 
-class ChangeBgByLinkModelInputDto(BaseModel):
+class ChangeBgBackgroundInputDto(BaseModel):
+    """
+    Represents the background of a change background request.
+
+    Attributes:
+        background_link (AnyHttpUrl | None): The URL link to the background image.
+        background_id (str | None): ID of a background registered
+        with the backgrounds API, used instead of ``background_link``.
+        output_width (int | None): Width of the output image,
+        the width of the background if not specified,
+        at most ``max_output_width`` setting.
+    """
+
+    background_link: AnyHttpUrl | None = None
+    background_id: str | None = Field(default=None, pattern=BACKGROUND_ID_PATTERN)
+    output_width: int | None = Field(
+        default=None,
+        gt=0,
+        le=settings.max_output_width,
+    )
+
+    @model_validator(mode="after")
+    def check_background(self) -> "ChangeBgBackgroundInputDto":
+        """
+        Checks that exactly one background source is given.
+
+        :raises ValueError: if none or both of the sources are given.
+        :return: validated model.
+        """
+        if (self.background_link is None) == (self.background_id is None):
+            raise ValueError("Either background_link or background_id is required")
+        return self
+
+
+class ChangeBgByLinkModelInputDto(ChangeBgBackgroundInputDto):
     """
     Represents the input data transfer object (DTO)
     for changing the background of an image by providing links.
 
     Attributes:
         image_link (HttpUrl): The URL link to the  image.
-        background_link (AnyHttpUrl): The URL link to the background image.
+        background_link (AnyHttpUrl | None): The URL link to the background image.
+        background_id (str | None): ID of a registered background,
+        used instead of ``background_link``.
+        output_width (int | None): Width of the output image,
+        the width of the background if not specified.
         position (Change_BgPositionModelInputDTO | None):
         The position of the  image on the background, or None if not specified.
+        quality (QualityTier | None): Mask quality tier, chosen from the image size
+        if not specified.
+        rembg_model (str | None): rembg model, one of ``rembg_models`` setting,
+        the default model if not specified, rejected by backends
+        without model variants.
+        preserve_shadows (bool): Segment with the shadows backend and carry
+        soft shadows of the car over to the background.
 
     Examples:
         input_dto = ChangeBgByLinkModelInputDto(image_link="https://example.com/car.jpg",
@@ -56,21 +106,34 @@ class ChangeBgByLinkModelInputDto(BaseModel):
     """
 
     image_link: HttpUrl
-    background_link: AnyHttpUrl
     container_name: str
     position: ChangeBgPositionModelInputDto | None
+    quality: QualityTier | None = None
+    rembg_model: RembgModelName | None = None
+    preserve_shadows: bool = False
 
 
-class BulkChangeBgByLinkModelInputDto(BaseModel):
+class BulkChangeBgByLinkModelInputDto(ChangeBgBackgroundInputDto):
     """
     Represents the input data transfer object (DTO)
     for changing the background of a  image by providing links.
 
     Attributes:
         image_link (HttpUrl): The URL link to the  image.
-        background_link (AnyHttpUrl): The URL link to the background image.
+        background_link (AnyHttpUrl | None): The URL link to the background image.
+        background_id (str | None): ID of a registered background,
+        used instead of ``background_link``.
+        output_width (int | None): Width of the output image,
+        the width of the background if not specified.
         position (Change_BgPositionModelInputDTO | None):
         The position of the image on the background, or None if not specified.
+        quality (QualityTier | None): Mask quality tier, chosen from the image size
+        if not specified.
+        rembg_model (str | None): rembg model, one of ``rembg_models`` setting,
+        the default model if not specified, rejected by backends
+        without model variants.
+        preserve_shadows (bool): Segment with the shadows backend and carry
+        soft shadows of the car over to the background.
 
     Examples:
         input_dto = ChangeBgByLinkModelInputDto(link="https://example.com/car.jpg",
@@ -79,9 +142,11 @@ class BulkChangeBgByLinkModelInputDto(BaseModel):
     """
 
     image_links: list[HttpUrl]
-    background_link: AnyHttpUrl
     container_name: str
     position: ChangeBgPositionModelInputDto | None
+    quality: QualityTier | None = None
+    rembg_model: RembgModelName | None = None
+    preserve_shadows: bool = False
 
 
 class BulkChangeBgModelOutputDto(BaseModel):
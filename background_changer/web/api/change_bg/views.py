@@ -1,21 +1,32 @@
-import io
 import shutil
 
-import httpx
-from fastapi import APIRouter, BackgroundTasks, UploadFile
-from PIL import Image
-from pydantic import AnyHttpUrl
-from starlette.responses import FileResponse
+import numpy as np
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import Response
 
+from background_changer.services.http.dependency import get_image_downloader
 from background_changer.settings import settings
+from background_changer.utils.background_cache import background_cache
+from background_changer.utils.background_library import (
+    background_library,
+    resize_to_width,
+)
+from background_changer.utils.bulk import BulkImage, change_backgrounds_bulk
+from background_changer.utils.downloads import ImageDownloader
 from background_changer.utils.image_utils import (
     change_background_image,
-    change_background_image_2,
+    change_background_in_memory,
     generate_unique_name,
 )
+from background_changer.utils.pipeline import decode_image
+from background_changer.utils.resolution import QualityTier
+from background_changer.utils.segmentation import check_model_supported
+from background_changer.utils.session_pool import RembgModelName
 from background_changer.web.api.change_bg.schema import (
     BulkChangeBgByLinkModelInputDto,
     BulkChangeBgModelOutputDto,
+    ChangeBgBackgroundInputDto,
     ChangeBgByLinkModelInputDto,
     ChangeBgModelOutputDto,
     ChangeBgPositionModelInputDto,
@@ -24,18 +35,65 @@ from background_changer.web.api.change_bg.schema import (
 router = APIRouter()
 
 
-async def fetch_and_save_image(url: str, path: str, img_format: str = "JPEG") -> None:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-        response.raise_for_status()
-        image_bytes = await response.aread()
-        image = Image.open(io.BytesIO(image_bytes))
-        # Check if the image is PNG
-        if image.format == "PNG":
-            # Convert to JPEG
-            image = image.convert("RGB")
-
-        image.save(path, format=img_format)
+async def load_background(
+    payload: ChangeBgBackgroundInputDto,
+    downloader: ImageDownloader,
+) -> np.ndarray:
+    """
+    Loads the decoded background of a request.
+
+    Registered backgrounds are taken from the library, pre-sized plates
+    are used when ``output_width`` matches one of them.
+    Linked backgrounds go through the background cache.
+
+    :param payload: request with the background.
+    :param downloader: downloader of linked backgrounds.
+    :raises HTTPException: if background is not registered.
+    :return: read-only RGB array of ``output_width`` width if it's given.
+    """
+    # Widths without a stored plate are resized from the full resolution
+    # background, which mustn't block the event loop.
+    if payload.background_id is not None:
+        try:
+            return await run_in_threadpool(
+                background_library.plate,
+                payload.background_id,
+                payload.output_width,
+            )
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Background not found")
+    background = await background_cache.fetch(
+        str(payload.background_link),
+        downloader.fetch,
+    )
+    if payload.output_width:
+        return await run_in_threadpool(
+            resize_to_width,
+            background,
+            payload.output_width,
+        )
+    return background
+
+
+def check_rembg_model_supported(
+    backend: str,
+    rembg_model: str | None,
+    preserve_shadows: bool = False,
+) -> None:
+    """
+    Rejects a rembg model requested from a backend without model variants.
+
+    :param backend: name of the segmentation backend of the endpoint.
+    :param rembg_model: requested rembg model.
+    :param preserve_shadows: whether ``segmentation_backend_3`` is used instead.
+    :raises HTTPException: if the model can't be used by the backend.
+    """
+    if preserve_shadows:
+        backend = settings.segmentation_backend_3
+    try:
+        check_model_supported(backend, rembg_model)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
 
 
 def construct_file_path_and_url(filename: str) -> tuple[str, str]:
@@ -48,12 +106,6 @@ def construct_file_path(filename: str) -> str:
     return f"{settings.DEFAULT_MEDIA_PATH}/{filename}"
 
 
-async def save_background_image(background_link: AnyHttpUrl, bg_name: str) -> str:
-    background_image_path = f"{settings.DEFAULT_MEDIA_PATH}/{bg_name}.jpg"
-    await fetch_and_save_image(str(background_link), background_image_path)
-    return background_image_path
-
-
 def change_background_task(
     background_tasks: BackgroundTasks,
     file_name: str,
@@ -63,6 +115,7 @@ def change_background_task(
     output_image_path: str,
     position: ChangeBgPositionModelInputDto,
     container_name: str | None,
+    rembg_model: str | None = None,
 ):
     background_tasks.add_task(
         func=change_background_image,
@@ -73,6 +126,7 @@ def change_background_task(
         output_image_path=output_image_path,
         container_name=container_name,
         position=position,
+        rembg_model=rembg_model,
     )
 
 
@@ -80,32 +134,32 @@ def change_background_task(
 async def bulk_change_backgrounds_by_image_urls(
     background_tasks: BackgroundTasks,
     payload: BulkChangeBgByLinkModelInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
 ):
-    file_links: list[str] = []
-    bg_name = f"bg_{generate_unique_name()}"
-    background_image_path = await save_background_image(
-        payload.background_link,
-        bg_name,
+    check_rembg_model_supported(
+        settings.segmentation_backend,
+        payload.rembg_model,
+        payload.preserve_shadows,
     )
-    for image_link in payload.image_links:
+    file_links: list[str] = []
+    images: list[BulkImage] = []
+    background = await load_background(payload, downloader)
+    downloads = await downloader.fetch_all([str(link) for link in payload.image_links])
+    for image in downloads:
         file_name = str(generate_unique_name())
-        image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_image.jpg"
-        await fetch_and_save_image(str(image_link), image_path)
-        rm_image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_rmbg.png"
-        file_path = construct_file_path(f"{file_name}_chbg.jpg")
         file_url = f"/{payload.container_name}/{file_name}_chbg.jpg"
         print("Public URL to view the image:", file_url)
         file_links.append(file_url)
-        change_background_task(
-            background_tasks=background_tasks,
-            file_name=file_name,
-            image_path=image_path,
-            rm_image_path=rm_image_path,
-            background_image_path=background_image_path,
-            output_image_path=file_path,
-            container_name=payload.container_name,
-            position=payload.position or ChangeBgPositionModelInputDto(),
-        )
+        images.append(BulkImage(file_name=file_name, image=image))
+    background_tasks.add_task(
+        func=change_backgrounds_bulk,
+        images=images,
+        background=background,
+        container_name=payload.container_name,
+        rembg_model=payload.rembg_model,
+        preserve_shadows=payload.preserve_shadows,
+        **(payload.position or ChangeBgPositionModelInputDto()).model_dump(),
+    )
 
     return BulkChangeBgModelOutputDto(file_links=file_links)
 
@@ -113,29 +167,30 @@ async def bulk_change_backgrounds_by_image_urls(
 @router.post("/by_link/", response_model=ChangeBgModelOutputDto)
 async def change_background_by_image_urls(
     payload: ChangeBgByLinkModelInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
 ):
-    file_name = str(generate_unique_name())
-    bg_name = f"bg_{generate_unique_name()}"
-    image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
-    background_image_path = await save_background_image(
-        payload.background_link,
-        bg_name,
+    check_rembg_model_supported(
+        settings.segmentation_backend,
+        payload.rembg_model,
+        payload.preserve_shadows,
     )
-    await fetch_and_save_image(str(payload.image_link), image_path)
-    rm_image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_rmbg.png"
-    file_path = construct_file_path(f"{file_name}_chbg.jpg")
+    file_name = str(generate_unique_name())
+    background = await load_background(payload, downloader)
+    image = await downloader.fetch(str(payload.image_link))
     file_url = f"/{payload.container_name}/{file_name}_chbg.jpg"
     print("Public URL to view the image:", file_url)
-    change_background_image(
-        file_name=file_name,
-        image_path=image_path,
-        rm_image_path=rm_image_path,
-        background_image_path=background_image_path,
-        output_image_path=file_path,
-        container_name=payload.container_name,
-        position=payload.position or ChangeBgPositionModelInputDto(),
-    )
-    return ChangeBgModelOutputDto(file_path=file_path, file_link=file_url)
+    with image:
+        await run_in_threadpool(
+            change_background_in_memory,
+            file_name=file_name,
+            image=image,
+            background=background,
+            container_name=payload.container_name,
+            position=payload.position or ChangeBgPositionModelInputDto(),
+            rembg_model=payload.rembg_model,
+            preserve_shadows=payload.preserve_shadows,
+        )
+    return ChangeBgModelOutputDto(file_link=file_url)
 
 
 @router.post("/upload/", response_model=ChangeBgModelOutputDto)
@@ -143,7 +198,9 @@ def change_background(
     background_tasks: BackgroundTasks,
     image: UploadFile,
     background_image: UploadFile,
+    rembg_model: RembgModelName | None = None,
 ) -> ChangeBgModelOutputDto:
+    check_rembg_model_supported(settings.segmentation_backend, rembg_model)
     file_name = str(generate_unique_name())
     image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
     rm_image_path, _ = construct_file_path_and_url(f"{file_name}_rmbg.png")
@@ -162,156 +219,127 @@ def change_background(
         output_image_path=output_path,
         # container_name=payload.container_name,
         # position=payload.position or ChangeBgPositionModelInputDto(),
+        rembg_model=rembg_model,
     )
     return ChangeBgModelOutputDto(file_path=output_path, file_link=image_url)
 
 
 @router.post(
     "/upload_image/",
-    response_class=FileResponse,
+    response_class=Response,
 )
 def change_background_and_return_file(
     image: UploadFile,
     background_image: UploadFile,
+    rembg_model: RembgModelName | None = None,
+    preserve_shadows: bool = False,
 ):
-    file_name = str(generate_unique_name())
-    image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
-    rm_image_path, _ = construct_file_path_and_url(f"{file_name}_rmbg.png")
-    background_image_path, _ = construct_file_path_and_url(background_image.filename)
-    with open(background_image_path, "wb") as buffer:
-        shutil.copyfileobj(background_image.file, buffer)
-    with open(image_path, "wb") as buffer2:
-        shutil.copyfileobj(image.file, buffer2)
-    output_path, _ = construct_file_path_and_url(f"{file_name}_chbg.jpg")
-    change_background_image(
-        file_name=file_name,
-        image_path=image_path,
-        rm_image_path=rm_image_path,
-        background_image_path=background_image_path,
-        output_image_path=output_path,
+    check_rembg_model_supported(
+        settings.segmentation_backend,
+        rembg_model,
+        preserve_shadows,
+    )
+    result = change_background_in_memory(
+        file_name=str(generate_unique_name()),
+        image=image.file,
+        background=decode_image(background_image.file),
         position=ChangeBgPositionModelInputDto(),
+        rembg_model=rembg_model,
+        preserve_shadows=preserve_shadows,
     )
-    return output_path
+    return Response(content=result, media_type="image/jpeg")
 
 
 @router.post(
     "/upload_image_2/",
-    response_class=FileResponse,
+    response_class=Response,
     tags=["Change Background 2"],
 )
 def change_background_and_return_file_2(
     image: UploadFile,
     background_image: UploadFile,
+    quality: QualityTier | None = None,
+    rembg_model: RembgModelName | None = None,
+    preserve_shadows: bool = False,
 ):
-    file_name = str(generate_unique_name())
-    image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
-    rm_image_path, _ = construct_file_path_and_url(f"{file_name}_rmbg.png")
-    background_image_path, _ = construct_file_path_and_url(background_image.filename)
-    with open(background_image_path, "wb") as buffer:
-        shutil.copyfileobj(background_image.file, buffer)
-    with open(image_path, "wb") as buffer2:
-        shutil.copyfileobj(image.file, buffer2)
-    output_path, _ = construct_file_path_and_url(f"{file_name}_chbg.jpg")
-    change_background_image_2(
-        image_path=image_path,
-        rm_image_path=rm_image_path,
-        background_image_path=background_image_path,
-        output_image_path=output_path,
+    check_rembg_model_supported(
+        settings.segmentation_backend_2,
+        rembg_model,
+        preserve_shadows,
+    )
+    result = change_background_in_memory(
+        file_name=str(generate_unique_name()),
+        image=image.file,
+        background=decode_image(background_image.file),
         position=ChangeBgPositionModelInputDto(),
+        backend=settings.segmentation_backend_2,
+        quality=quality,
+        rembg_model=rembg_model,
+        preserve_shadows=preserve_shadows,
     )
-    return output_path
+    return Response(content=result, media_type="image/jpeg")
 
 
 @router.post(
     "/by_link_image/",
-    response_class=FileResponse,
+    response_class=Response,
 )
 async def change_background_by_image_urls_and_return_file(
     payload: ChangeBgByLinkModelInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
 ):
-    file_name = str(generate_unique_name())
-    bg_name = f"bg_{generate_unique_name()}"
-    image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
-    background_image_path = await save_background_image(
-        payload.background_link,
-        bg_name,
-    )
-    await fetch_and_save_image(str(payload.image_link), image_path)
-    rm_image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_rmbg.png"
-    file_path = construct_file_path(f"{file_name}_chbg.jpg")
-    file_url = f"/{payload.container_name}/{file_name}_chbg.jpg"
-    print("Public URL to view the image:", file_url)
-    change_background_image(
-        file_name=file_name,
-        image_path=image_path,
-        rm_image_path=rm_image_path,
-        background_image_path=background_image_path,
-        output_image_path=file_path,
-        position=payload.position or ChangeBgPositionModelInputDto(),
+    check_rembg_model_supported(
+        settings.segmentation_backend,
+        payload.rembg_model,
+        payload.preserve_shadows,
     )
-    return file_path
+    background = await load_background(payload, downloader)
+    image = await downloader.fetch(str(payload.image_link))
+    with image:
+        result = await run_in_threadpool(
+            change_background_in_memory,
+            file_name=str(generate_unique_name()),
+            image=image,
+            background=background,
+            position=payload.position or ChangeBgPositionModelInputDto(),
+            rembg_model=payload.rembg_model,
+            preserve_shadows=payload.preserve_shadows,
+        )
+    return Response(content=result, media_type="image/jpeg")
 
 
 @router.post(
     "/by_link_image_2/",
-    response_class=FileResponse,
+    response_model=ChangeBgModelOutputDto,
     tags=["Change Background 2"],
 )
 async def change_background_by_image_urls_and_return_file_2(
     payload: ChangeBgByLinkModelInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
 ):
-    file_name = str(generate_unique_name())
-    bg_name = f"bg_{generate_unique_name()}"
-    image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
-    background_image_path = await save_background_image(
-        payload.background_link,
-        bg_name,
+    check_rembg_model_supported(
+        settings.segmentation_backend_2,
+        payload.rembg_model,
+        payload.preserve_shadows,
     )
-    await fetch_and_save_image(str(payload.image_link), image_path)
-    rm_image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_rmbg.png"
-    file_path, _ = construct_file_path_and_url(f"{file_name}_chbg.jpg")
+    file_name = str(generate_unique_name())
+    background = await load_background(payload, downloader)
+    image = await downloader.fetch(str(payload.image_link))
     file_url = f"/{payload.container_name}/{file_name}_chbg.jpg"
-    change_background_image_2(
-        file_name=file_name,
-        image_path=image_path,
-        rm_image_path=rm_image_path,
-        background_image_path=background_image_path,
-        output_image_path=file_path,
-        container_name=payload.container_name,
-        position=payload.position or ChangeBgPositionModelInputDto(),
-    )
-    return ChangeBgModelOutputDto(file_path=file_path, file_link=file_url)
-
-
-@router.post("/bulk_by_links/", response_model=BulkChangeBgModelOutputDto)
-async def bulk_change_backgrounds_by_image_urls(
-    background_tasks: BackgroundTasks,
-    payload: BulkChangeBgByLinkModelInputDto,
-):
-    file_paths: list[str] = []
-    file_links: list[str] = []
-    bg_name = f"bg_{generate_unique_name()}"
-    background_image_path = await save_background_image(
-        payload.background_link,
-        bg_name,
-    )
-    for image_link in payload.image_links:
-        file_name = str(generate_unique_name())
-        image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_image.jpg"
-        await fetch_and_save_image(str(image_link), image_path)
-        rm_image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_rmbg.png"
-        file_path, file_url = construct_file_path_and_url(f"{file_name}_chbg.jpg")
-        file_paths.append(file_path)
-        file_links.append(file_url)
-        change_background_task(
-            background_tasks,
-            image_path,
-            rm_image_path,
-            background_image_path,
-            file_path,
-            payload.position or ChangeBgPositionModelInputDto(),
+    with image:
+        await run_in_threadpool(
+            change_background_in_memory,
+            file_name=file_name,
+            image=image,
+            background=background,
+            container_name=payload.container_name,
+            position=payload.position or ChangeBgPositionModelInputDto(),
+            backend=settings.segmentation_backend_2,
+            quality=payload.quality,
+            rembg_model=payload.rembg_model,
+            preserve_shadows=payload.preserve_shadows,
         )
-    return BulkChangeBgModelOutputDto(file_paths=file_paths, file_links=file_links)
+    return ChangeBgModelOutputDto(file_link=file_url)
 
 
 @router.post(
@@ -322,28 +350,32 @@ async def bulk_change_backgrounds_by_image_urls(
 async def bulk_change_backgrounds_by_image_urls_2(
     background_tasks: BackgroundTasks,
     payload: BulkChangeBgByLinkModelInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
 ):
-    file_paths: list[str] = []
-    file_links: list[str] = []
-    bg_name = f"bg_{generate_unique_name()}"
-    background_image_path = await save_background_image(
-        payload.background_link,
-        bg_name,
+    check_rembg_model_supported(
+        settings.segmentation_backend_2,
+        payload.rembg_model,
+        payload.preserve_shadows,
     )
-    for image_link in payload.image_links:
+    file_links: list[str] = []
+    images: list[BulkImage] = []
+    background = await load_background(payload, downloader)
+    downloads = await downloader.fetch_all([str(link) for link in payload.image_links])
+    for image in downloads:
         file_name = str(generate_unique_name())
-        image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_image.jpg"
-        await fetch_and_save_image(str(image_link), image_path)
-        rm_image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_rmbg.png"
         file_path, file_url = construct_file_path_and_url(f"{file_name}_chbg.jpg")
-        file_paths.append(file_path)
         file_links.append(file_url)
-        background_tasks.add_task(
-            func=change_background_image_2,
-            image_path=image_path,
-            rm_image_path=rm_image_path,
-            background_image_path=background_image_path,
-            output_image_path=file_path,
-            position=payload.position,
+        images.append(
+            BulkImage(file_name=file_name, image=image, output_image_path=file_path),
         )
-    return BulkChangeBgModelOutputDto(file_paths=file_paths, file_links=file_links)
+    background_tasks.add_task(
+        func=change_backgrounds_bulk,
+        images=images,
+        background=background,
+        backend=settings.segmentation_backend_2,
+        quality=payload.quality,
+        rembg_model=payload.rembg_model,
+        preserve_shadows=payload.preserve_shadows,
+        **(payload.position or ChangeBgPositionModelInputDto()).model_dump(),
+    )
+    return BulkChangeBgModelOutputDto(file_links=file_links)
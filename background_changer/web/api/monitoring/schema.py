@@ -0,0 +1,15 @@
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict
+
+
+class ModelStateDTO(BaseModel):
+    """Load state of a segmentation model in the current worker."""
+
+    name: str
+    status: str
+    device: Optional[str] = None
+    load_seconds: Optional[float] = None
+    loaded_at: Optional[float] = None
+    error: Optional[str] = None
+    model_config = ConfigDict(from_attributes=True)
@@ -1,4 +1,8 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from starlette import status
+
+from background_changer.utils.model_registry import model_registry
+from background_changer.web.api.monitoring.schema import ModelStateDTO
 
 router = APIRouter()
 
@@ -10,3 +14,33 @@ def health_check() -> None:
 
     It returns 200 if the project is healthy.
     """
+
+
+@router.get("/models", response_model=list[ModelStateDTO])
+def get_models_state() -> list[ModelStateDTO]:
+    """
+    Shows load state of the models in the current worker.
+
+    :returns: state of every registered model.
+    """
+    return [ModelStateDTO.model_validate(state) for state in model_registry.status()]
+
+
+@router.post("/models/{name}/reload", response_model=ModelStateDTO)
+def reload_model(name: str) -> ModelStateDTO:
+    """
+    Reloads a model in the current worker.
+
+    :param name: name of the registered model.
+    :raises HTTPException: if the model is not registered.
+    :returns: state of the reloaded model.
+    """
+    try:
+        model_registry.reload(name)
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Model {name} is not registered",
+        )
+    state = next(state for state in model_registry.status() if state.name == name)
+    return ModelStateDTO.model_validate(state)
@@ -1,5 +1,8 @@
 from pydantic import BaseModel, ConfigDict, Field, HttpUrl
 
+from background_changer.utils.resolution import QualityTier
+from background_changer.utils.session_pool import RembgModelName
+
 
 class RemoveBgModelDto(BaseModel):
     """
@@ -50,12 +53,19 @@ class RemoveBgByLinkModelInputDto(BaseModel):
 
     Attributes:
         link (HttpUrl): The URL link to the image.
+        quality (QualityTier | None): Mask quality tier, chosen from the image size
+        if not specified.
+        rembg_model (str | None): rembg model, one of ``rembg_models`` setting,
+        the default model if not specified, rejected by backends
+        without model variants.
 
     Examples:
         input_dto = RemoveBgByLinkModelInputDto(link="https://example.com/car.jpg",
     """
 
     link: HttpUrl
+    quality: QualityTier | None = None
+    rembg_model: RembgModelName | None = None
 
 
 class BulkRemoveBgByLinkModelInputDto(BaseModel):
@@ -65,12 +75,19 @@ class BulkRemoveBgByLinkModelInputDto(BaseModel):
 
     Attributes:
         link (HttpUrl): The URL link to the image.
+        quality (QualityTier | None): Mask quality tier, chosen from the image size
+        if not specified.
+        rembg_model (str | None): rembg model, one of ``rembg_models`` setting,
+        the default model if not specified, rejected by backends
+        without model variants.
 
     Examples:
         input_dto = RemoveBgByLinkModelInputDto(link="https://example.com/car.jpg",
     """
 
     links: list[HttpUrl]
+    quality: QualityTier | None = None
+    rembg_model: RembgModelName | None = None
 
 
 class BulkRemoveBgModelOutputDto(BaseModel):
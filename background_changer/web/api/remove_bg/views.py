@@ -1,19 +1,22 @@
-import io
+import asyncio
 import shutil
 
-import httpx
-from fastapi import APIRouter, BackgroundTasks, UploadFile
-from PIL import Image
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile
 from pydantic import AnyHttpUrl
 from starlette.responses import FileResponse
 
+from background_changer.services.http.dependency import get_image_downloader
 from background_changer.settings import settings
+from background_changer.utils.downloads import ImageDownloader
 from background_changer.utils.image_utils import (
     generate_unique_name,
     remove_background_image,
     remove_background_image_2,
     remove_background_image_3,
 )
+from background_changer.utils.resolution import QualityTier
+from background_changer.utils.segmentation import check_model_supported
+from background_changer.utils.session_pool import RembgModelName
 from background_changer.web.api.remove_bg.schema import (
     BulkRemoveBgByLinkModelInputDto,
     BulkRemoveBgModelOutputDto,
@@ -24,13 +27,18 @@ from background_changer.web.api.remove_bg.schema import (
 router = APIRouter()
 
 
-async def fetch_and_save_image(url: str, path: str, img_format: str = "JPEG") -> None:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-        response.raise_for_status()
-        image_bytes = await response.aread()
-        image = Image.open(io.BytesIO(image_bytes))
-        image.save(path, format=img_format)
+def check_rembg_model_supported(backend: str, rembg_model: str | None) -> None:
+    """
+    Rejects a rembg model requested from a backend without model variants.
+
+    :param backend: name of the segmentation backend of the endpoint.
+    :param rembg_model: requested rembg model.
+    :raises HTTPException: if the model can't be used by the backend.
+    """
+    try:
+        check_model_supported(backend, rembg_model)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
 
 
 def construct_file_path_and_url(filename: str) -> tuple[str, str]:
@@ -43,7 +51,9 @@ def construct_file_path_and_url(filename: str) -> tuple[str, str]:
 def remove_background_return_url(
     background_tasks: BackgroundTasks,
     image: UploadFile,
+    rembg_model: RembgModelName | None = None,
 ) -> RemoveBgModelOutputDto:
+    check_rembg_model_supported(settings.segmentation_backend, rembg_model)
     file_name = str(generate_unique_name())
     image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
     rm_image_path, image_url = construct_file_path_and_url(f"{file_name}_rmbg.png")
@@ -53,6 +63,7 @@ def remove_background_return_url(
         func=remove_background_image,
         image_path=image_path,
         rm_image_path=rm_image_path,
+        rembg_model=rembg_model,
     )
     return RemoveBgModelOutputDto(file_path=rm_image_path, file_link=image_url)
 
@@ -61,15 +72,18 @@ def remove_background_return_url(
 async def remove_background_by_image_urls(
     background_tasks: BackgroundTasks,
     payload: RemoveBgByLinkModelInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
 ):
+    check_rembg_model_supported(settings.segmentation_backend, payload.rembg_model)
     file_name = str(generate_unique_name())
     image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
-    await fetch_and_save_image(str(payload.link), image_path)
+    await downloader.fetch_and_save(str(payload.link), image_path)
     rm_image_path, file_url = construct_file_path_and_url(f"{file_name}_rmbg.png")
     background_tasks.add_task(
         func=remove_background_image,
         image_path=image_path,
         rm_image_path=rm_image_path,
+        rembg_model=payload.rembg_model,
     )
     return RemoveBgModelOutputDto(file_path=rm_image_path, file_link=file_url)
 
@@ -80,7 +94,9 @@ async def remove_background_by_image_urls(
 )
 def remove_background_and_return_file(
     image: UploadFile,
+    rembg_model: RembgModelName | None = None,
 ):
+    check_rembg_model_supported(settings.segmentation_backend, rembg_model)
     file_name = str(generate_unique_name())
     image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
     rm_image_path, _ = construct_file_path_and_url(f"{file_name}_rmbg.png")
@@ -89,6 +105,7 @@ def remove_background_and_return_file(
     remove_background_image(
         image_path=image_path,
         rm_image_path=rm_image_path,
+        rembg_model=rembg_model,
     )
     return rm_image_path
 
@@ -126,7 +143,10 @@ def remove_background_and_return_file(
 )
 def remove_background_and_return_file_2(
     image: UploadFile,
+    quality: QualityTier | None = None,
+    rembg_model: RembgModelName | None = None,
 ):
+    check_rembg_model_supported(settings.segmentation_backend_2, rembg_model)
     file_name = str(generate_unique_name())
     image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
     rm_image_path, _ = construct_file_path_and_url(f"{file_name}_rmbg.png")
@@ -135,6 +155,8 @@ def remove_background_and_return_file_2(
     remove_background_image_2(
         image_path=image_path,
         rm_image_path=rm_image_path,
+        quality=quality,
+        rembg_model=rembg_model,
     )
     return rm_image_path
 
@@ -145,14 +167,17 @@ def remove_background_and_return_file_2(
 )
 async def remove_background_by_image_url_and_return_file(
     payload: RemoveBgByLinkModelInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
 ):
+    check_rembg_model_supported(settings.segmentation_backend, payload.rembg_model)
     file_name = str(generate_unique_name())
     image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
-    await fetch_and_save_image(str(payload.link), image_path)
+    await downloader.fetch_and_save(str(payload.link), image_path)
     rm_image_path, _ = construct_file_path_and_url(f"{file_name}_rmbg.png")
     remove_background_image(
         image_path=image_path,
         rm_image_path=rm_image_path,
+        rembg_model=payload.rembg_model,
     )
     return rm_image_path
 
@@ -164,14 +189,18 @@ async def remove_background_by_image_url_and_return_file(
 )
 async def remove_background_by_image_url_and_return_file_2(
     payload: RemoveBgByLinkModelInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
 ):
+    check_rembg_model_supported(settings.segmentation_backend_2, payload.rembg_model)
     file_name = str(generate_unique_name())
     image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
-    await fetch_and_save_image(str(payload.link), image_path)
+    await downloader.fetch_and_save(str(payload.link), image_path)
     rm_image_path, _ = construct_file_path_and_url(f"{file_name}_rmbg.png")
     remove_background_image_2(
         image_path=image_path,
         rm_image_path=rm_image_path,
+        quality=payload.quality,
+        rembg_model=payload.rembg_model,
     )
     return rm_image_path
 
@@ -183,14 +212,18 @@ async def remove_background_by_image_url_and_return_file_2(
 )
 async def remove_background_by_image_url_and_return_file_2(
     payload: RemoveBgByLinkModelInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
 ):
+    check_rembg_model_supported(settings.segmentation_backend_3, payload.rembg_model)
     file_name = str(generate_unique_name())
     image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_original.jpg"
-    await fetch_and_save_image(str(payload.link), image_path)
+    await downloader.fetch_and_save(str(payload.link), image_path)
     rm_image_path, _ = construct_file_path_and_url(f"{file_name}_rmbg.png")
     remove_background_image_3(
         image_path=image_path,
         rm_image_path=rm_image_path,
+        quality=payload.quality,
+        rembg_model=payload.rembg_model,
     )
     return rm_image_path
 
@@ -199,19 +232,25 @@ async def remove_background_by_image_url_and_return_file_2(
 async def bulk_remove_backgrounds_by_image_urls(
     background_tasks: BackgroundTasks,
     payload: BulkRemoveBgByLinkModelInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
 ):
+    check_rembg_model_supported(settings.segmentation_backend, payload.rembg_model)
     file_links: list[AnyHttpUrl] = []
+    downloads = []
     for image_link in payload.links:
         file_name = str(generate_unique_name())
         image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_car.jpg"
-        await fetch_and_save_image(str(image_link), image_path)
+        downloads.append(downloader.fetch_and_save(str(image_link), image_path))
         rm_image_path, file_url = construct_file_path_and_url(f"{file_name}_rmbg.png")
         file_links.append(file_url)
         background_tasks.add_task(
             func=remove_background_image,
             image_path=image_path,
             rm_image_path=rm_image_path,
+            rembg_model=payload.rembg_model,
         )
+    # Background tasks only run once every image is saved.
+    await asyncio.gather(*downloads)
     return BulkRemoveBgModelOutputDto(file_links=file_links)
 
 
@@ -223,13 +262,16 @@ async def bulk_remove_backgrounds_by_image_urls(
 async def bulk_remove_backgrounds_by_image_urls_2(
     background_tasks: BackgroundTasks,
     payload: BulkRemoveBgByLinkModelInputDto,
+    downloader: ImageDownloader = Depends(get_image_downloader),
 ):
+    check_rembg_model_supported(settings.segmentation_backend_2, payload.rembg_model)
     file_paths: list[str] = []
     file_links: list[str] = []
+    downloads = []
     for image_link in payload.links:
         file_name = str(generate_unique_name())
         image_path = f"{settings.DEFAULT_MEDIA_PATH}/{file_name}_car.jpg"
-        await fetch_and_save_image(str(image_link), image_path)
+        downloads.append(downloader.fetch_and_save(str(image_link), image_path))
         rm_image_path, file_url = construct_file_path_and_url(f"{file_name}_rmbg.png")
         file_paths.append(rm_image_path)
         file_links.append(file_url)
@@ -237,5 +279,8 @@ async def bulk_remove_backgrounds_by_image_urls_2(
             func=remove_background_image_2,
             image_path=image_path,
             rm_image_path=rm_image_path,
+            quality=payload.quality,
+            rembg_model=payload.rembg_model,
         )
+    await asyncio.gather(*downloads)
     return BulkRemoveBgModelOutputDto(file_paths=file_paths, file_links=file_links)
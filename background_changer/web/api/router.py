@@ -1,6 +1,12 @@
 from fastapi.routing import APIRouter
 
-from background_changer.web.api import change_bg, echo, monitoring, remove_bg
+from background_changer.web.api import (
+    backgrounds,
+    change_bg,
+    echo,
+    monitoring,
+    remove_bg,
+)
 
 api_router = APIRouter()
 api_router.include_router(monitoring.router)
@@ -11,6 +17,11 @@ api_router.include_router(
     prefix="/change_bg",
     tags=["Change Background"],
 )
+api_router.include_router(
+    backgrounds.router,
+    prefix="/backgrounds",
+    tags=["Backgrounds"],
+)
 api_router.include_router(
     remove_bg.router,
     prefix="/remove_bg",
@@ -5,9 +5,16 @@ from prometheus_fastapi_instrumentator.instrumentation import (
     PrometheusFastApiInstrumentator,
 )
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.concurrency import run_in_threadpool
 
+from background_changer.services.http.lifetime import (
+    init_http_client,
+    shutdown_http_client,
+)
 from background_changer.settings import settings
 from background_changer.tkq import broker
+from background_changer.utils.inference import configure_torch_threads
+from background_changer.utils.model_registry import model_registry
 
 
 def _setup_db(app: FastAPI) -> None:  # pragma: no cover
@@ -29,6 +36,22 @@ def _setup_db(app: FastAPI) -> None:  # pragma: no cover
     app.state.db_session_factory = session_factory
 
 
+async def _setup_models(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Configures torch threads, stores model registry
+    in the state and preloads models.
+
+    Models are loaded in a threadpool, so the event loop
+    is not blocked while weights are read.
+
+    :param app: fastAPI application.
+    """
+    configure_torch_threads()
+    app.state.model_registry = model_registry
+    if settings.preload_models:
+        await run_in_threadpool(model_registry.load_all)
+
+
 def setup_prometheus(app: FastAPI) -> None:  # pragma: no cover
     """
     Enables prometheus integration.
@@ -59,6 +82,8 @@ def register_startup_event(
         # if not broker.is_worker_process:
         #     await broker.startup()
         _setup_db(app)
+        init_http_client(app)
+        await _setup_models(app)
         # init_redis(app)
         # init_rabbit(app)
         # setup_prometheus(app)
@@ -83,6 +108,7 @@ def register_shutdown_event(
         if not broker.is_worker_process:
             await broker.shutdown()
         await app.state.db_engine.dispose()
+        await shutdown_http_client(app)
 
         # await shutdown_redis(app)
         # await shutdown_rabbit(app)
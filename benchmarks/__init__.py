@@ -0,0 +1 @@
+"""Micro-benchmarks for the image processing pipeline."""
@@ -0,0 +1,93 @@
+"""
+Throughput of a bulk change background job for a growing number of threads.
+
+Segmentation is replaced by a fixed box mask blurred with OpenCV,
+so the benchmark measures how decoding, compositing and encoding
+on ``bulk_workers`` threads scale with cores without downloading weights::
+
+    python -m benchmarks.bulk --images 100 --workers 1 2 4 8
+"""
+
+import argparse
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from background_changer.settings import settings
+from background_changer.utils import bulk
+from background_changer.utils.pipeline import encode_image
+from background_changer.utils.resolution import QualityTier
+from background_changer.utils.segmentation import SegmentationBackend
+from benchmarks.utils import measure
+
+
+class BlurredBoxBackend(SegmentationBackend):
+    """Box mask with soft edges, costs about as much as the mask cleanup."""
+
+    def segment(
+        self,
+        image: np.ndarray,
+        quality: Optional[QualityTier] = None,
+        model: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Computes a blurred box in the middle of the image.
+
+        :param image: RGB image.
+        :param quality: ignored.
+        :param model: ignored.
+        :return: uint8 alpha.
+        """
+        height, width = image.shape[:2]
+        alpha = np.zeros((height, width), dtype=np.uint8)
+        alpha[height // 4 : -height // 4, width // 8 : -width // 8] = 255
+        return cv2.GaussianBlur(alpha, (0, 0), 5)
+
+    def parallel_segmentations(self) -> int:
+        """
+        The box doesn't run on intra-op threads, so it's as parallel as the job.
+
+        :return: ``bulk_workers``.
+        """
+        return max(1, settings.bulk_workers)
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1280)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    bulk.get_backend = lambda name: BlurredBoxBackend()
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    photo = encode_image(
+        rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8),
+    )
+    images = [
+        bulk.BulkImage(file_name=str(index), image=photo)
+        for index in range(args.images)
+    ]
+
+    print(f"{args.images} images {args.width}x{args.height}")
+    for workers in args.workers:
+        settings.bulk_workers = workers
+        elapsed = measure(
+            lambda: bulk.change_backgrounds_bulk(
+                images,
+                background,
+                backend="benchmark",
+            ),
+            args.repeat,
+            warmup=1,
+        )
+        print(f"  {workers} threads: {args.images / elapsed * 1000:8.1f} images/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compositing of a car cutout onto a background.
+
+Compares the per-channel float64 loop of the old ``add_car_to_background``
+with the in-place float32 kernel::
+
+    python -m benchmarks.compositing --width 4000 --height 3000
+"""
+
+import argparse
+
+import cv2
+import numpy as np
+
+from background_changer.utils.compositing import blend_into
+from benchmarks.utils import measure
+
+
+def legacy_blend(
+    background: np.ndarray,
+    car: np.ndarray,
+    x_offset: int,
+    y_offset: int,
+) -> None:
+    """
+    Compositing loop of the old ``add_car_to_background``.
+
+    :param background: BGR background, modified in place.
+    :param car: BGRA car cutout.
+    :param x_offset: left offset of the car.
+    :param y_offset: top offset of the car.
+    """
+    mask = car[:, :, 3] / 255.0
+    for c in range(3):
+        background[
+            y_offset : y_offset + car.shape[0],
+            x_offset : x_offset + car.shape[1],
+            c,
+        ] = (
+            background[
+                y_offset : y_offset + car.shape[0],
+                x_offset : x_offset + car.shape[1],
+                c,
+            ]
+            * (1 - mask)
+            + car[:, :, c] * mask
+        )
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--scale", type=float, default=0.62)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    car_width = int(args.width * args.scale)
+    car_height = int(car_width * 0.6)
+    car = rng.integers(0, 255, (car_height, car_width, 4), dtype=np.uint8)
+    x_offset = (args.width - car_width) // 2
+    y_offset = (args.height - car_height) // 2
+
+    legacy = measure(
+        lambda: legacy_blend(background.copy(), car, x_offset, y_offset),
+        args.repeat,
+    )
+    current = measure(
+        lambda: blend_into(
+            background.copy(),
+            cv2.cvtColor(car, cv2.COLOR_BGRA2BGR),
+            car[:, :, 3],
+            x_offset,
+            y_offset,
+        ),
+        args.repeat,
+    )
+    copy = measure(lambda: background.copy(), args.repeat)
+    print(f"car {car_width}x{car_height} on {args.width}x{args.height}")
+    print(f"  float64 loop: {legacy - copy:8.1f} ms")
+    print(f"  float32 kernel: {current - copy:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Per-image CPU time of BriaRMBG with and without BatchNorm folding.
+
+Usage::
+
+    python -m benchmarks.fusion --size 1024 --threads 4
+"""
+
+import argparse
+import copy
+
+import torch
+
+from background_changer.utils.briarmbg import BriaRMBG
+from benchmarks.utils import measure
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    model = BriaRMBG().eval()
+    fused = copy.deepcopy(model).fuse()
+    image = torch.randn(1, 3, args.size, args.size)
+
+    with torch.inference_mode():
+        plain_ms = measure(lambda: model.forward_mask(image), args.repeat)
+        fused_ms = measure(lambda: fused.forward_mask(image), args.repeat)
+        max_diff = (model.forward_mask(image) - fused.forward_mask(image)).abs().max()
+
+    print(f"input {args.size}x{args.size}, {args.threads} threads")
+    print(f"conv+bn+relu: {plain_ms:8.1f} ms")
+    print(f"fused:        {fused_ms:8.1f} ms ({plain_ms / fused_ms:.2f}x)")
+    print(f"max mask difference: {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Guided filter matting of the trimap band against the whole image.
+
+The mask is the same soft-edged ellipse for every image size,
+so the band version should take about the same time at any
+resolution, while the whole image version grows with the area::
+
+    python -m benchmarks.matting --sizes 3000x4000 6000x4000
+"""
+
+import argparse
+
+import cv2
+import numpy as np
+
+from background_changer.utils.matting import matte
+from benchmarks.utils import measure
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", default=["3000x4000", "6000x4000"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        height, width = map(int, size.split("x"))
+        image = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        alpha = np.zeros((height, width), dtype=np.uint8)
+        cv2.ellipse(alpha, (2000, 1600), (1500, 700), 0, 0, 360, 255, -1)
+        alpha = cv2.GaussianBlur(alpha, (0, 0), 2)
+        band = measure(lambda: matte(image, alpha), args.repeat, warmup=1)
+        whole = measure(
+            lambda: matte(image, alpha, tile_size=max(height, width)),
+            args.repeat,
+            warmup=1,
+        )
+        print(f"{width}x{height}")
+        print(f"  band tiles:  {band:8.1f} ms")
+        print(f"  whole image: {whole:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+BriaRMBG pre- and postprocessing on large photos.
+
+Compares the old float pipelines with the uint8 ones: the input
+is resized in uint8 into a reused buffer, the mask is converted to uint8
+at model resolution and upscaled once::
+
+    python -m benchmarks.preprocessing --size 1024
+"""
+
+import argparse
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torchvision.transforms.functional import normalize
+
+from background_changer.utils.preprocessing import (
+    input_buffer,
+    postprocess_image,
+    preprocess_image,
+)
+from benchmarks.utils import measure
+
+RESOLUTIONS = {"12MP": (3000, 4000), "24MP": (4000, 6000)}
+
+
+def legacy_preprocess_image(im: np.ndarray, model_input_size: list) -> torch.Tensor:
+    """
+    Preprocessing before the uint8 pipeline.
+
+    :param im: RGB image.
+    :param model_input_size: [height, width] of the model input.
+    :return: normalized input.
+    """
+    im_tensor = torch.tensor(im, dtype=torch.float32).permute(2, 0, 1)
+    im_tensor = F.interpolate(
+        torch.unsqueeze(im_tensor, 0),
+        size=model_input_size,
+        mode="bilinear",
+    ).type(torch.uint8)
+    image = torch.divide(im_tensor, 255.0)
+    return normalize(image, [0.5, 0.5, 0.5], [1.0, 1.0, 1.0])
+
+
+def legacy_postprocess_image(result: torch.Tensor, im_size: list) -> np.ndarray:
+    """
+    Postprocessing before the uint8 pipeline.
+
+    :param result: model output of shape (1, 1, h, w).
+    :param im_size: (height, width) of the original image.
+    :return: uint8 alpha.
+    """
+    result = torch.squeeze(F.interpolate(result, size=im_size, mode="bilinear"), 0)
+    ma = torch.max(result)
+    mi = torch.min(result)
+    result = (result - mi) / (ma - mi)
+    im_array = (result * 255).permute(1, 2, 0).cpu().data.numpy().astype(np.uint8)
+    return np.squeeze(im_array)
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    model_input_size = [args.size, args.size]
+    for name, shape in RESOLUTIONS.items():
+        image = rng.integers(0, 255, (*shape, 3), dtype=np.uint8)
+        legacy = measure(
+            lambda: legacy_preprocess_image(image, model_input_size),
+            args.repeat,
+            warmup=1,
+        )
+        with input_buffer(*model_input_size) as buffer:
+            current = measure(
+                lambda: preprocess_image(image, model_input_size, out=buffer),
+                args.repeat,
+                warmup=1,
+            )
+        print(f"{name} preprocess:  legacy {legacy:8.1f} ms  uint8 {current:8.1f} ms")
+
+        mask = torch.rand(1, 1, args.size, args.size)
+        legacy = measure(
+            lambda: legacy_postprocess_image(mask, shape),
+            args.repeat,
+            warmup=1,
+        )
+        current = measure(lambda: postprocess_image(mask, shape), args.repeat, warmup=1)
+        print(f"{name} postprocess: legacy {legacy:8.1f} ms  uint8 {current:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Single-pass rembg with mask cleanup against the old double pass.
+
+The old pipeline ran rembg twice on encoded PNG bytes, the second time
+on its own cutout. The new one computes the mask once and cleans it up
+on the array level. Masks are compared with the double pass.
+Unlike other benchmarks this one needs the rembg weights
+(``rembg_model``), they are downloaded on the first run::
+
+    python -m benchmarks.rembg_passes --images photos/
+"""
+
+import argparse
+import io as _io
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+from rembg import new_session, remove
+from skimage import io
+
+from background_changer.settings import settings
+from background_changer.utils.masks import clean_mask
+from background_changer.utils.quantization import mask_iou, mask_mae
+from benchmarks.utils import measure
+
+
+def _load_images(folder: Optional[Path]) -> list[np.ndarray]:
+    if folder is None:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 255, (1200, 1800, 3), dtype=np.uint8)]
+    return [io.imread(path)[:, :, :3] for path in sorted(folder.glob("*.jp*g"))]
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=Path, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    session = new_session(settings.rembg_model)
+
+    def double_pass(image: np.ndarray) -> np.ndarray:  # noqa: WPS430
+        buffer = _io.BytesIO()
+        Image.fromarray(image).save(buffer, "PNG")
+        output = remove(remove(buffer.getvalue(), session=session), session=session)
+        return np.asarray(Image.open(_io.BytesIO(output)))[:, :, 3]
+
+    def single_pass(image: np.ndarray) -> np.ndarray:  # noqa: WPS430
+        return clean_mask(remove(image, session=session, only_mask=True))
+
+    for image in _load_images(args.images):
+        reference = double_pass(image) / 255
+        mask = single_pass(image) / 255
+        print(f"image {image.shape[1]}x{image.shape[0]}")
+        print(
+            f"  double pass: {measure(lambda: double_pass(image), args.repeat):8.1f} ms"
+        )
+        print(
+            f"  single pass: {measure(lambda: single_pass(image), args.repeat):8.1f} ms  "
+            f"IoU {mask_iou(mask, reference):.4f}  "
+            f"MAE {mask_mae(mask, reference):.4f}",
+        )
+
+
+if __name__ == "__main__":
+    main()
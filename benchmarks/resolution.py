@@ -0,0 +1,67 @@
+"""
+Cost and mask quality of BriaRMBG at every model input size.
+
+Masks at every size are upscaled to the source resolution and compared
+with the mask at the largest size. Meaningful quality numbers need
+the real weights (``--pretrained``) and real photos (``--images``)::
+
+    python -m benchmarks.resolution --pretrained --images photos/
+"""
+
+import argparse
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from skimage import io
+
+from background_changer.settings import settings
+from background_changer.utils.briarmbg import BriaRMBG
+from background_changer.utils.inference import inference_context
+from background_changer.utils.preprocessing import postprocess_image, preprocess_image
+from background_changer.utils.quantization import mask_iou, mask_mae
+from benchmarks.utils import measure
+
+
+def _load_images(folder: Optional[Path]) -> list[np.ndarray]:
+    if folder is None:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 255, (1200, 1800, 3), dtype=np.uint8)]
+    return [io.imread(path)[:, :, :3] for path in sorted(folder.glob("*.jp*g"))]
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=Path, default=None)
+    parser.add_argument("--pretrained", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.pretrained:
+        model = BriaRMBG.from_pretrained(settings.bria_model_name)
+    else:
+        model = BriaRMBG()
+    model = model.eval().fuse()
+    sizes = sorted(settings.model_input_sizes)
+
+    def segment(image: np.ndarray, size: int) -> np.ndarray:  # noqa: WPS430
+        with inference_context():
+            mask = model.forward_mask(preprocess_image(image, [size, size]))
+            return postprocess_image(mask, image.shape[:2]) / 255
+
+    for image in _load_images(args.images):
+        reference = segment(image, sizes[-1])
+        print(f"image {image.shape[1]}x{image.shape[0]}")
+        for size in sizes:
+            elapsed = measure(lambda: segment(image, size), args.repeat, warmup=1)
+            mask = segment(image, size)
+            print(
+                f"  {size:5d}: {elapsed:8.1f} ms  "
+                f"IoU {mask_iou(mask, reference):.4f}  "
+                f"MAE {mask_mae(mask, reference):.4f}",
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import statistics
+import time
+from typing import Any, Callable
+
+
+def measure(func: Callable[[], Any], repeat: int = 10, warmup: int = 2) -> float:
+    """
+    Measures median wall time of a call.
+
+    :param func: function to measure.
+    :param repeat: number of measured calls.
+    :param warmup: number of calls before measuring.
+    :return: median time in milliseconds.
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)